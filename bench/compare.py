@@ -0,0 +1,38 @@
+import sys
+import json
+
+
+METRICS = ('samples_per_sec', 'p50_ms', 'p99_ms', 'rss_mib')
+HIGHER_IS_BETTER = {'samples_per_sec'}
+
+
+def _key(result):
+    return (result['benchmark'], result['hosts'], result.get('endpoint', ''), result.get('range', ''))
+
+
+def compare(old, new):
+    """ 按 (benchmark, hosts, endpoint, range) 对齐两次结果，返回 [(key, metric, old, new, 变化比例)] """
+    rows = []
+    previous = {_key(result): result for result in old['results']}
+    for result in new['results']:
+        base = previous.get(_key(result))
+        if base is None:
+            continue
+        for metric in METRICS:
+            if metric in result and base.get(metric):
+                rows.append((_key(result), metric, base[metric], result[metric], result[metric] / base[metric] - 1))
+    return rows
+
+
+if __name__ == '__main__':
+    # python -m bench.compare bench/results/<old>.json bench/results/<new>.json
+    with open(sys.argv[1]) as f:
+        old = json.load(f)
+    with open(sys.argv[2]) as f:
+        new = json.load(f)
+    print(f"{(old['commit'] or '?')[:12]} -> {(new['commit'] or '?')[:12]}")
+    for (benchmark, hosts, endpoint, span), metric, a, b, change in compare(old, new):
+        better = (change > 0) == (metric in HIGHER_IS_BETTER)
+        mark = '' if abs(change) < 0.05 else ('+' if better else '-')
+        name = f"{benchmark} hosts={hosts} {endpoint} {f'range={span}' if span else ''}".strip()
+        print(f"{name:<55} {metric:<16} {a:>10} -> {b:>10} ({change:+.1%}) {mark}")
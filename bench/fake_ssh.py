@@ -0,0 +1,137 @@
+import re
+import sys
+import time
+import socket
+import argparse
+import threading
+import paramiko
+from logging import getLogger
+from bench.synthetic import SyntheticHost
+from src.monitor import BATCH_COMMANDS
+from src.monitor.get_batch import BATCH_MARKER
+from src.server_info import INFO_COMMANDS
+
+logger = getLogger('my.fake_ssh')
+
+MARKER = re.compile(re.escape(BATCH_MARKER).replace(r'\{\}', r'(\w+)'))
+# 单独执行的命令 (batch=False) -> 输出的 key；{valid} 按没有失效 GPU 处理
+SINGLE_COMMANDS = {command.replace('{valid}', ''): key for key, command in {**BATCH_COMMANDS, **INFO_COMMANDS}.items()}
+
+
+def host_configs(names, port, password='bench'):
+    """ 连接到假 SSH 服务器的 hosts.yml 配置：用户名即模拟主机名 """
+    return {
+        name: dict(hostname='127.0.0.1', port=port, username=name, password=password,
+                   allow_agent=False, look_for_keys=False)
+        for name in names
+    }
+
+
+class _Handler(paramiko.ServerInterface):
+    def __init__(self, server):
+        self.server = server
+        self.host = None
+
+    def get_allowed_auths(self, username):
+        return 'password,publickey'
+
+    def _auth(self, username):
+        if username not in self.server.hosts:
+            return paramiko.AUTH_FAILED
+        self.host = self.server.hosts[username]
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username, password):
+        return self._auth(username)
+
+    def check_auth_publickey(self, username, key):
+        return self._auth(username)
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.server.reply, args=(self.host, channel, command.decode()), daemon=True).start()
+        return True
+
+
+class FakeSSHServer:
+    """
+    本地的假 SSH 服务器，回放 SyntheticHost 的命令输出：以模拟主机名为用户名登录 (任意密码)，
+    批量命令按分隔符逐段返回，单独的命令按命令文本查找。每次 exec 在返回前等待 latency 秒 (模拟网络与远端耗时)。
+    不支持 SFTP、端口转发等，/api/disk 等接口会失败
+    """
+
+    def __init__(self, hosts, latency=0.05, port=0):
+        self.hosts = {host.name: host for host in hosts}
+        self.latency = latency
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', port))
+        self.sock.listen(1024)
+        self.port = self.sock.getsockname()[1]
+        self.requests = 0
+        self._channels = set()  # 已打开、尚未回复的 channel (Channel 被回收时会自动关闭)
+
+    def output(self, host, command):
+        outputs = host.outputs(time.time())
+        keys = MARKER.findall(command)
+        if keys:
+            return ''.join('\n' + BATCH_MARKER.format(key) + '\n' + outputs[key] for key in keys)
+        return outputs[SINGLE_COMMANDS[command]]
+
+    def reply(self, host, channel, command):
+        try:
+            time.sleep(self.latency)
+            try:
+                output, status = self.output(host, command), 0
+            except KeyError:
+                output, status = '', 127
+            self.requests += 1
+            channel.sendall(output.encode())
+            channel.send_exit_status(status)
+        except Exception as e:
+            logger.warning(f"Failed to reply to {command[:80]!r}: [{type(e)}] {e}")
+        finally:
+            channel.close()
+            self._channels.discard(channel)
+
+    def _serve(self, conn):
+        transport = paramiko.Transport(conn)
+        transport.add_server_key(self.host_key)
+        try:
+            transport.start_server(server=_Handler(self))
+        except Exception as e:
+            logger.warning(f"SSH negotiation failed: [{type(e)}] {e}")
+            return
+        while transport.is_active():
+            channel = transport.accept(1)  # 取出已打开的 channel，避免队列增长
+            if channel is not None:
+                self._channels.add(channel)
+
+    def serve_forever(self):
+        while True:
+            conn, _ = self.sock.accept()
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == '__main__':
+    # python -m bench.fake_ssh --hosts 8 --latency 0.05 --port 2222
+    parser = argparse.ArgumentParser(description='Fake SSH targets replaying synthetic command output')
+    parser.add_argument('--hosts', type=int, default=8)
+    parser.add_argument('--gpus', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds before each reply')
+    parser.add_argument('--port', type=int, default=0)
+    args = parser.parse_args()
+    server = FakeSSHServer([SyntheticHost(f'bench{i:03d}', n_gpus=args.gpus) for i in range(args.hosts)],
+                           latency=args.latency, port=args.port)
+    print(server.port, flush=True)  # 供 bench/run.py 读取
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        sys.exit(0)
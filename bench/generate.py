@@ -0,0 +1,58 @@
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from bench.synthetic import SyntheticHost
+from src.users import host_users
+from monitor import catch_up
+
+
+def generate_host(data_dir, host, days, interval=10, end=None, derive=True):
+    """
+    生成一台主机过去 days 天的历史 data/{host}.json (用户名按采集器的方式编码为 id)，
+    derive=True 时再像采集器启动时一样拆分分段、导入列式存储并生成汇总。返回 JSONL 的总字节数
+    """
+    end = (time.time() if end is None else end) // interval * interval
+    users = host_users(host.name, data_dir)
+    path = os.path.join(data_dir, f'{host.name}.json')
+    with open(path, 'w') as f:
+        buffer = []
+        for record in host.records(end - days * 86400, end, interval):
+            buffer.append(json.dumps(users.encode(record)) + '\n')
+            if len(buffer) >= 10000:
+                f.write(''.join(buffer))
+                buffer = []
+        f.write(''.join(buffer))
+    size = os.path.getsize(path)
+    if derive:
+        catch_up(data_dir, host.name)
+    return size
+
+
+def generate(data_dir, n_hosts, days, interval=10, n_gpus=8, derive=True, jobs=None, end=None):
+    """ 用 jobs 个进程生成 bench000 ... 共 n_hosts 台主机截至 end (默认为当前时刻) 的历史，返回 {host: JSONL 字节数} """
+    os.makedirs(data_dir, exist_ok=True)
+    end = time.time() if end is None else end
+    hosts = [SyntheticHost(f'bench{i:03d}', n_gpus=n_gpus) for i in range(n_hosts)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(generate_host, data_dir, host, days, interval, end, derive) for host in hosts]
+        return {host.name: future.result() for host, future in zip(hosts, futures)}
+
+
+if __name__ == '__main__':
+    # python -m bench.generate --data-dir bench/work/data --hosts 4 --days 30
+    parser = argparse.ArgumentParser(description='Generate synthetic monitoring history')
+    parser.add_argument('--data-dir', default='bench/work/data')
+    parser.add_argument('--hosts', type=int, default=4)
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--interval', type=int, default=10)
+    parser.add_argument('--gpus', type=int, default=8)
+    parser.add_argument('--no-derive', action='store_true', help='only write JSONL (no segments, columns or rollups)')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: CPU count)')
+    args = parser.parse_args()
+    start = time.time()
+    sizes = generate(args.data_dir, args.hosts, args.days, args.interval, args.gpus, not args.no_derive, args.jobs)
+    for host, size in sizes.items():
+        print(f"{host}: {size / 1024 / 1024:.1f} MiB")
+    print(f"Generated {sum(sizes.values()) / 1024 / 1024 / 1024:.2f} GiB in {time.time() - start:.0f}s")
@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import time
+import pyotp
+import argparse
+import threading
+import urllib.error
+from bench.run import ROOT, ApiServer, prepare_data, start_fake_ssh, git_commit, _percentiles, _rss
+
+
+def _slow(server, path, errors):
+    """ 发起一次慢请求 (占用服务端的线程或事件循环)，失败时记录状态码 """
+    try:
+        server.get(path)
+    except urllib.error.HTTPError as e:
+        errors.append(f'{path.split("?")[0]} {e.code}')
+    except OSError as e:
+        errors.append(f'{path.split("?")[0]} {type(e).__name__}')
+
+
+def probe(server, interval, duration):
+    """
+    每 interval 秒发起一次 /api/dashboard (开环，不等上一次返回)，
+    延迟从计划发送的时刻算起，服务端排队的时间也计入
+    """
+    latencies, threads = [], []
+    start = time.perf_counter()
+
+    def send(planned):
+        server.get('/api/dashboard')
+        latencies.append(time.perf_counter() - planned)
+
+    for i in range(int(duration / interval)):
+        planned = start + i * interval
+        time.sleep(max(planned - time.perf_counter(), 0))
+        thread = threading.Thread(target=send, args=(planned,), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return dict(requests=len(latencies), **_percentiles(latencies), max_ms=round(max(latencies) * 1000, 1))
+
+
+def main(args):
+    # /api/ports 需要有效的 TOTP；这里的密钥只用于本次压测
+    os.environ['TOTP_SECRET'] = secret = pyotp.random_base32()
+    names = [f'bench{i:03d}' for i in range(args.hosts)]
+    work, data = prepare_data(args.hosts, args.days, args.gpus)
+    ssh, port = start_fake_ssh(args.hosts, args.latency, args.gpus, os.path.join(work, 'fake_ssh.log'))
+    server = ApiServer(work, names, port)
+    commit, dirty = git_commit()
+    report = dict(commit=commit, dirty=dirty, params=vars(args))
+    try:
+        server.get('/api/dashboard')
+        report['idle'] = probe(server, args.interval, args.duration)
+        print(f"idle:   {report['idle']}", file=sys.stderr)
+
+        # 慢请求：端口 (SSH)、未同步过的磁盘用量 (SSH)、强制刷新的服务器信息 (SSH)、长区间历史 (文件读取)
+        now, span = data['end'], args.days * 86400
+        totp = pyotp.TOTP(secret, interval=30, digits=6)
+        paths = [f'/api/ports?host={names[i % args.hosts]}&secret={totp.now()}' for i in range(3)]
+        paths += [f'/api/disk?host={names[i % args.hosts]}' for i in range(3)]
+        paths += [f'/api/server_info?host={names[i % args.hosts]}&refresh=true' for i in range(2)]
+        paths += [f'/api/history?host={names[i % args.hosts]}&start={now - span}&end={now}' for i in range(2)]
+        errors = []
+        load = [threading.Thread(target=_slow, args=(server, path, errors), daemon=True) for path in paths]
+        for thread in load:
+            thread.start()
+        report['loaded'] = probe(server, args.interval, args.duration)
+        for thread in load:
+            thread.join()
+        report['loaded'].update(load_requests=len(paths), load_errors=errors, **_rss(server.process.pid))
+        print(f"loaded: {report['loaded']}", file=sys.stderr)
+    finally:
+        server.close()
+        ssh.terminate()
+        ssh.wait()
+    output = args.output or os.path.join(ROOT, 'bench', 'results', f"responsiveness-{(commit or 'unknown')[:12]}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(output)
+
+
+if __name__ == '__main__':
+    # python -m bench.responsiveness --days 30 --latency 2
+    parser = argparse.ArgumentParser(description='Measure /api/dashboard latency while slow SSH and history requests are running')
+    parser.add_argument('--hosts', type=int, default=2)
+    parser.add_argument('--days', type=float, default=30, help='days of generated history per host (also the /api/history range)')
+    parser.add_argument('--gpus', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=2, help='fake SSH reply latency in seconds')
+    parser.add_argument('--interval', type=float, default=0.05, help='seconds between /api/dashboard requests')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of /api/dashboard requests per phase')
+    parser.add_argument('--output', help='result file (default: bench/results/responsiveness-<commit>.json)')
+    main(parser.parse_args())
@@ -0,0 +1,243 @@
+import os
+import sys
+import json
+import time
+import yaml
+import shutil
+import socket
+import argparse
+import platform
+import subprocess
+import urllib.request
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from bench.generate import generate
+from bench.fake_ssh import host_configs
+from src.ssh_pool import SSHPool
+from src.writer import RecordWriter
+from monitor import sample_server, catch_up
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = os.path.join(ROOT, 'bench', 'work')
+
+
+def _percentiles(values):
+    values = np.asarray(values, dtype=np.float64) * 1000
+    return dict(p50_ms=round(float(np.percentile(values, 50)), 2), p99_ms=round(float(np.percentile(values, 99)), 2))
+
+
+def _rss(pid):
+    """ 进程当前和峰值的常驻内存 (MiB)，读取 /proc (仅 Linux) """
+    result = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'VmHWM'):
+                    result['rss_mib' if key == 'VmRSS' else 'peak_rss_mib'] = round(int(value.split()[0]) / 1024, 1)
+    except FileNotFoundError:
+        pass
+    return result
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_ssh(n_hosts, latency, n_gpus, log):
+    """ 在子进程中启动假 SSH 服务器 (不与被测代码争抢 GIL)，返回 (进程, 端口) """
+    with open(log, 'a') as stderr:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'bench.fake_ssh', '--hosts', str(n_hosts), '--latency', str(latency), '--gpus', str(n_gpus)],
+            cwd=ROOT, stdout=subprocess.PIPE, stderr=stderr, text=True,
+        )
+    return process, int(process.stdout.readline())
+
+
+def prepare_data(n_hosts, days, n_gpus, jobs=None):
+    """ 生成 (或复用已生成的) 历史数据，返回工作目录及 {bytes, seconds, end} """
+    work = os.path.join(WORK_DIR, f'{n_hosts}h-{days:g}d-{n_gpus}g')
+    done = os.path.join(work, 'generated.json')
+    if not os.path.exists(done):
+        shutil.rmtree(work, ignore_errors=True)
+        start = time.time()
+        sizes = generate(os.path.join(work, 'data'), n_hosts, days, n_gpus=n_gpus, jobs=jobs, end=start)
+        with open(done, 'w') as f:
+            json.dump(dict(bytes=sum(sizes.values()), seconds=round(time.time() - start, 1), end=start), f)
+    with open(done) as f:
+        return work, json.load(f)
+
+
+def bench_collector(n_hosts, port, rounds, workers, data_dir):
+    """
+    采集器吞吐：每轮对所有主机并发采样一次 (同 monitor_server 中的 sample_server)，样本交给写入线程。
+    第一轮建立连接并发现主机能力，不计入结果
+    """
+    names = [f'bench{i:03d}' for i in range(n_hosts)]
+    pool = SSHPool(host_configs(names, port))
+    shutil.rmtree(data_dir, ignore_errors=True)
+    os.makedirs(data_dir)
+    usages = {name: catch_up(data_dir, name) for name in names}
+    states = {name: {} for name in names}
+    writer = RecordWriter(data_dir).start()
+
+    def sample(name):
+        start = time.perf_counter()
+        record = sample_server(pool, name, states[name])
+        writer.submit(record, usages[name])
+        return time.perf_counter() - start
+
+    latencies, errors = [], 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(sample, names))
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for future in [executor.submit(sample, name) for name in names]:
+                try:
+                    latencies.append(future.result())
+                except Exception:
+                    errors += 1
+    writer.close()
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return dict(benchmark='collector', hosts=n_hosts, samples=len(latencies), errors=errors,
+                samples_per_sec=round(len(latencies) / elapsed, 1), **_percentiles(latencies))
+
+
+class ApiServer:
+    """ 在工作目录中用 uvicorn 启动 main.py (独立进程，便于统计其内存) """
+
+    def __init__(self, work, names, ssh_port):
+        self.work = work
+        for name in ('main.py', 'src', 'templates', 'assets'):
+            link = os.path.join(work, name)
+            if not os.path.lexists(link):
+                os.symlink(os.path.join(ROOT, name), link)
+        with open(os.path.join(work, 'hosts.yml'), 'w') as f:
+            yaml.dump(host_configs(names, ssh_port), f)
+        self.port = _free_port()
+        # 假 SSH 服务器不支持 SFTP，磁盘用量的后台同步会失败，日志写到 api.log 中
+        with open(os.path.join(work, 'api.log'), 'a') as log:
+            self.process = subprocess.Popen(
+                [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(self.port), '--log-level', 'warning'],
+                cwd=work, stdout=log, stderr=log,
+            )
+        deadline = time.time() + 60
+        while True:
+            try:
+                self.get('/api/hosts')
+                break
+            except OSError:
+                if time.time() > deadline or self.process.poll() is not None:
+                    raise RuntimeError("API server did not start")
+                time.sleep(0.2)
+
+    def get(self, path):
+        request = urllib.request.Request(f'http://127.0.0.1:{self.port}{path}', headers={'Accept-Encoding': 'gzip'})
+        with urllib.request.urlopen(request, timeout=300) as response:
+            return response.read()
+
+    def measure(self, paths):
+        """ 依次请求 paths，返回各次的耗时 (秒) 与平均响应大小 """
+        latencies, size = [], 0
+        for path in paths:
+            start = time.perf_counter()
+            size += len(self.get(path))
+            latencies.append(time.perf_counter() - start)
+        return latencies, size // max(len(paths), 1)
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def bench_api(server, n_hosts, ranges, requests, now):
+    """ 各接口的延迟与服务进程的内存；历史区间以生成数据的结束时刻 now 为终点 (数据可能是之前生成的) """
+    names = [f'bench{i:03d}' for i in range(n_hosts)]
+    results = []
+
+    def run(endpoint, paths, **extra):
+        server.measure(paths[:2])  # 预热 (页缓存、内存映射、惰性加载)
+        latencies, size = server.measure(paths)
+        results.append(dict(benchmark='api', hosts=n_hosts, endpoint=endpoint, requests=len(paths),
+                            bytes=size, **extra, **_percentiles(latencies), **_rss(server.process.pid)))
+
+    run('/api/dashboard', ['/api/dashboard'] * requests)
+    run('/api/summary', [f'/api/summary?host={names[i % n_hosts]}' for i in range(requests)])
+    for span in ranges:
+        start = now - span
+        run('/api/history', [f'/api/history?host={names[i % n_hosts]}&start={start}&end={now}' for i in range(requests)], range=span)
+        run('/api/history?format=binary', [
+            f'/api/history?host={names[i % n_hosts]}&start={start}&end={now}&format=binary' for i in range(requests)
+        ], range=span)
+        step = max(60, int(span / 500))
+        run('/api/fleet_history', [
+            f'/api/fleet_history?metric=cuda_free&start={start}&end={now}&step={step}' for _ in range(max(requests // 5, 3))
+        ], range=span)
+    return results
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT, text=True).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def main(args):
+    commit, dirty = git_commit()
+    report = dict(
+        commit=commit, dirty=dirty, timestamp=time.time(),
+        python=platform.python_version(), platform=platform.platform(), cpus=os.cpu_count(),
+        params=vars(args), data={}, results=[],
+    )
+    for n_hosts in args.hosts:
+        work, data = prepare_data(n_hosts, args.days, args.gpus, args.jobs)
+        report['data'][n_hosts] = data
+        print(f"[{n_hosts} hosts] {data['bytes'] / 1024 / 1024:.0f} MiB of history", file=sys.stderr)
+        ssh, port = start_fake_ssh(n_hosts, args.latency, args.gpus, os.path.join(work, 'fake_ssh.log'))
+        try:
+            if not args.skip_collector:
+                result = bench_collector(n_hosts, port, args.rounds, args.workers, os.path.join(work, 'collector'))
+                report['results'].append(dict(result, latency=args.latency))
+                print(f"  collector: {result['samples_per_sec']} samples/s, p99 {result['p99_ms']} ms", file=sys.stderr)
+            if not args.skip_api:
+                server = ApiServer(work, [f'bench{i:03d}' for i in range(n_hosts)], port)
+                try:
+                    for result in bench_api(server, n_hosts, args.ranges, args.requests, data['end']):
+                        report['results'].append(result)
+                        print(f"  {result['endpoint']} {result.get('range', '')}: p50 {result['p50_ms']} ms, "
+                              f"p99 {result['p99_ms']} ms, rss {result.get('rss_mib')} MiB", file=sys.stderr)
+                finally:
+                    server.close()
+        finally:
+            ssh.terminate()
+            ssh.wait()
+    output = args.output or os.path.join(ROOT, 'bench', 'results', f"{(commit or 'unknown')[:12]}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(output)
+
+
+if __name__ == '__main__':
+    # python -m bench.run --hosts 1,8 --days 30 --ranges 3600,86400,604800
+    parser = argparse.ArgumentParser(description='Benchmark the collector and the web API on synthetic hosts')
+    parser.add_argument('--hosts', type=lambda s: [int(x) for x in s.split(',')], default=[1, 8], help='host counts, e.g. 1,8,32')
+    parser.add_argument('--days', type=float, default=7, help='days of generated history per host')
+    parser.add_argument('--gpus', type=int, default=8)
+    parser.add_argument('--ranges', type=lambda s: [int(x) for x in s.split(',')], default=[3600, 86400, 604800],
+                        help='/api/history range sizes in seconds')
+    parser.add_argument('--requests', type=int, default=30, help='requests per API measurement')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake SSH reply latency in seconds')
+    parser.add_argument('--rounds', type=int, default=10, help='collector sampling rounds')
+    parser.add_argument('--workers', type=int, default=32, help='collector sampling threads (max_workers in monitor_all)')
+    parser.add_argument('--jobs', type=int, default=None, help='processes used to generate history')
+    parser.add_argument('--skip-collector', action='store_true')
+    parser.add_argument('--skip-api', action='store_true')
+    parser.add_argument('--output', help='result file (default: bench/results/<commit>.json)')
+    main(parser.parse_args())
@@ -0,0 +1,137 @@
+import zlib
+import numpy as np
+
+
+# 模拟的用户名，每台主机从中选取一部分
+USERS = [f'user{i:02d}' for i in range(40)] + ['root', 'nobody']
+GPU_MEMORY = 81920  # MiB
+
+
+class SyntheticHost:
+    """
+    一台模拟主机：由主机名确定随机种子，既能生成历史记录 (与采集器写入的格式相同)，
+    也能在任意时刻给出各采集命令的输出 (供 bench/fake_ssh.py 回放)。
+    负载是以天为周期的波动加随机噪声，进程的 CPU 计数器随时间单调增加
+    """
+
+    def __init__(self, name, n_gpus=8, n_users=20, n_procs=300, nproc=64, memory_mib=515000, boot=1.6e9):
+        self.name = name
+        self.n_gpus = n_gpus
+        self.nproc = nproc
+        self.memory_mib = memory_mib
+        self.boot = boot
+        rng = np.random.default_rng(zlib.crc32(name.encode()))
+        self.users = list(rng.choice(USERS[:-2], size=n_users, replace=False)) + ['root']
+        self.phase = rng.uniform(0, 2 * np.pi)
+        # 进程：(pid, 用户, 占用的核数, 所在 GPU 或 -1, 显存 MiB)
+        pids = rng.choice(np.arange(1000, 400000), size=n_procs, replace=False)
+        owners = rng.choice(len(self.users), size=n_procs)
+        cores = rng.exponential(0.3, size=n_procs) * (rng.random(n_procs) < 0.3)
+        gpus = np.where(rng.random(n_procs) < 0.1, rng.integers(0, max(n_gpus, 1), size=n_procs), -1) if n_gpus else np.full(n_procs, -1)
+        memory = rng.integers(1000, 20000, size=n_procs)
+        self.procs = [
+            (int(pid), self.users[owner], float(core), int(gpu), int(mem))
+            for pid, owner, core, gpu, mem in zip(pids, owners, cores, gpus, memory)
+        ]
+        self.uuids = [f'GPU-{zlib.crc32(f"{name}:{i}".encode()):08x}-0000-0000-0000-{i:012x}' for i in range(n_gpus)]
+
+    def load(self, timestamp):
+        """ t 时刻的整体负载 (0~1) """
+        return 0.5 + 0.35 * np.sin(2 * np.pi * timestamp / 86400 + self.phase)
+
+    def busy(self, timestamp):
+        """ 开机以来 load 的积分 (秒)，用作单调递增的 CPU 计数器 """
+        omega = 2 * np.pi / 86400
+        return 0.5 * (timestamp - self.boot) - 0.35 / omega * (
+            np.cos(omega * timestamp + self.phase) - np.cos(omega * self.boot + self.phase)
+        )
+
+    # ---------- 历史记录 ----------
+
+    def records(self, start, end, interval=10, seed=0):
+        """ 按 interval 秒生成 [start, end) 内的记录 (逐条产出，内存占用与区间长度无关) """
+        rng = np.random.default_rng(seed ^ zlib.crc32(self.name.encode()))
+        cpu_users = [user for user in self.users if user != 'root']
+        gpu_procs = [proc for proc in self.procs if proc[3] >= 0]
+        for timestamp in np.arange(start, end, interval):
+            load = float(np.clip(self.load(timestamp) + rng.normal(0, 0.05), 0, 1))
+            cpu = 100 * load
+            memory = 100 * float(np.clip(load * 0.8 + rng.normal(0, 0.02), 0, 1))
+            active = rng.random(len(cpu_users)) < load
+            cpu_per_user = sorted(
+                ((user, round(float(rng.exponential(self.nproc * load * 10)), 2)) for user, on in zip(cpu_users, active) if on),
+                key=lambda x: x[1], reverse=True
+            )
+            memory_per_user = [(user, round(float(rng.exponential(5 * load)), 1)) for user, on in zip(cpu_users, active) if on]
+            cuda_used = np.clip(rng.normal(load, 0.2, size=self.n_gpus), 0, 1) * GPU_MEMORY
+            cuda_per_user = [
+                (f'cuda:{gpu}', user, int(mem * load)) for _, user, _, gpu, mem in gpu_procs if rng.random() < load
+            ]
+            yield {
+                'timestamp': float(timestamp),
+                'cpu': cpu,
+                'cpu_free': self.nproc * (1 - load),
+                'cpu_per_user': cpu_per_user,
+                'memory': memory,
+                'memory_free': float(self.memory_mib * (1 - memory / 100)),
+                'memory_per_user': memory_per_user,
+                'cuda': (cuda_used / GPU_MEMORY * 100).tolist(),
+                'cuda-free': (GPU_MEMORY - cuda_used).tolist(),
+                'cuda_per_user': cuda_per_user,
+                'host': self.name,
+            }
+
+    # ---------- 命令输出 ----------
+
+    def outputs(self, timestamp):
+        """ t 时刻各采集命令 (见 BATCH_COMMANDS、INFO_COMMANDS) 的输出 """
+        load = float(self.load(timestamp))
+        uptime, busy = timestamp - self.boot, self.busy(timestamp)
+        jiffies = int(uptime * 100) * self.nproc
+        pid2user = 'USER PID\n' + ''.join(f'{user} {pid}\n' for pid, user, *_ in self.procs)
+        proc_stat = ''.join(
+            f"{pid} (python) S 1 {pid} {pid} 0 -1 4194304 0 0 0 0 "
+            f"{int(core * busy * 100)} 0 0 0 20 0 1 0 {int(1e4 + pid)} 0 0\n"
+            for pid, _, core, _, _ in self.procs
+        )
+        memory_per_user = {}
+        for _, user, _, _, mem in self.procs:
+            memory_per_user[user] = memory_per_user.get(user, 0.0) + mem / self.memory_mib * 100 * load
+        gpu_used = [0] * self.n_gpus
+        for _, _, _, gpu, mem in self.procs:
+            if gpu >= 0:
+                gpu_used[gpu] = min(gpu_used[gpu] + int(mem * load), GPU_MEMORY)
+        outputs = {
+            'cpu_stat': f"cpu  {int(busy * 100) * self.nproc} 0 0 {jiffies - int(busy * 100) * self.nproc} 0 0 0 0 0 0\n",
+            'cpu_uptime': f"{uptime:.2f} {(uptime - busy) * self.nproc:.2f}\n",
+            'cpu_clk_tck': '100\n',
+            'cpu_nproc': f'{self.nproc}\n',
+            'cpu_proc_stat': proc_stat,
+            'cpu_pid2user': pid2user,
+            'memory': f"{100 * load * 0.8:.4f} {int(self.memory_mib * (1 - load * 0.8))}\n",
+            'memory_per_user': ''.join(f'{user} {mem:.1f}\n' for user, mem in sorted(memory_per_user.items())),
+            'cuda_lspci': ''.join(f'{i + 1:02x}:00.0 3D controller: NVIDIA Corporation GA100 [A100 SXM4 80GB] (rev a1)\n' for i in range(self.n_gpus)),
+            'cuda_list': ''.join(f'GPU {i}: NVIDIA A100-SXM4-80GB (UUID: {uuid})\n' for i, uuid in enumerate(self.uuids)),
+            'cuda': ''.join(f'{i}, {used}, {GPU_MEMORY}\n' for i, used in enumerate(gpu_used)),
+            'cuda_pid2user': pid2user,
+            'cuda_uuid': ''.join(f'{i}, {uuid}\n' for i, uuid in enumerate(self.uuids)),
+            'cuda_per_user': ''.join(
+                f'{pid}, {self.uuids[gpu]}, {int(mem * load)}\n' for pid, _, _, gpu, mem in self.procs if gpu >= 0
+            ),
+            # /api/server_info
+            'hostname': f'{self.name}.bench.local\n',
+            'lscpu': f"Model name: AMD EPYC 7763 64-Core Processor\nCPU MHz: 2450.000\nL3 cache: 256 MiB\nNUMA node(s): 2\n",
+            'cores': f'{self.nproc // 2}\n',
+            'nproc': f'{self.nproc}\n',
+            'scaling_cur_freq': '2450000\n',
+            'flags': 'flags : fpu avx avx2\n',
+            'meminfo': f'MemTotal: {self.memory_mib * 1024} kB\n',
+            'gpu': ''.join('NVIDIA A100-SXM4-80GB, 81920 MiB\n' for _ in range(self.n_gpus)),
+            'cuda_version': '12.2\n',
+            'os_release': 'PRETTY_NAME="Ubuntu 22.04.3 LTS"\n',
+            'uname': f'Linux {self.name} 5.15.0-91-generic #101-Ubuntu SMP x86_64 GNU/Linux\n',
+        }
+        if not self.n_gpus:
+            for key in ('cuda_lspci', 'cuda_list', 'cuda', 'cuda_uuid', 'cuda_per_user', 'gpu'):
+                outputs[key] = ''
+        return outputs
@@ -1,22 +1,34 @@
 import os
+import gzip
 import yaml
 import time
-import json
 import pyotp
 import socket
 import dotenv
-import paramiko
+import asyncio
 import traceback
-import subprocess
-import pandas as pd
-from io import StringIO
+import numpy as np
 from logging import getLogger
+from contextlib import asynccontextmanager
 from src.logger import set_logger
-from typing import List, Union, Dict
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse
+from typing import List, Union, Dict, Optional
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import Response, HTMLResponse, PlainTextResponse, StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
-from src.ssh_connect import ssh_connect, safe_exec_command
+from src.ssh_pool import SSHPool
+from src.storage import column_store, normalize_record
+from src.rollup import rollup_store, choose_resolution
+from src.latest import LatestCache
+from src.config import get_mapping, get_ignored_users, get_config_version
+from src.stream import iter_jsonl_rows, iter_column_rows, stream_json_array, dumps
+from src.columnar import SERIES, read_columns, to_json, to_binary
+from src.fleet import fleet_history, to_json as fleet_to_json
+from src.accounting import query_usage
+from src.server_info import ServerInfoCache, format_server_info
+from src.disk_usage import DiskUsageMirror
+from src.offload import Offloader
+from src.http_cache import ResponseCache, StaticCache
 
 dotenv.load_dotenv()
 set_logger('ServerMonitor', file='./log/web.log', basename='my')
@@ -25,9 +37,46 @@ logger = getLogger(f'my.web')
 # 获取数据文件路径
 DATA_DIR = './data'
 HOSTS = yaml.load(open('hosts.yml'), Loader=yaml.FullLoader)
+# 按主机复用的 SSH 连接池
+POOL = SSHPool(HOSTS)
+# 处理函数中的阻塞调用 (SSH、文件读取与解析) 都放到有界线程池中执行，每个端点有并发上限和超时
+OFFLOAD = Offloader(io_workers=16, ssh_workers=8)
+OFFLOAD.endpoint('history', concurrency=8, timeout=60)
+OFFLOAD.endpoint('fleet_history', concurrency=2, timeout=120)
+OFFLOAD.endpoint('usage', concurrency=4, timeout=30)
+OFFLOAD.endpoint('ip', concurrency=4, timeout=10)
+OFFLOAD.endpoint('disk', concurrency=4, timeout=90, executor='ssh')
+OFFLOAD.endpoint('ports', concurrency=2, timeout=90, executor='ssh')
+OFFLOAD.endpoint('server_info', concurrency=4, timeout=90, executor='ssh')
+
+
+async def offload(name, func, *args):
+    """ 在线程池中执行 func(*args)，超时返回 504 """
+    try:
+        return await OFFLOAD.run(name, func, *args)
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Timed out: {name}")
+
+@asynccontextmanager
+async def lifespan(app):
+    """ 启动最新记录、硬件信息和磁盘用量的后台任务，退出时取消 """
+    # 先在线程中读取一次最新记录，开始接受请求时缓存已就绪
+    await asyncio.to_thread(LATEST.refresh)
+    tasks = [asyncio.create_task(cache.watch()) for cache in (LATEST, SERVER_INFO, DISK_USAGE)]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 # 初始化 FastAPI 实例
-app = FastAPI(docs_url=None, redoc_url=None)
+app = FastAPI(docs_url=None, redoc_url=None, lifespan=lifespan)
+# 较大的响应 (主要是 JSON) 用 gzip 压缩；SSE 和已压缩的静态文件不受影响
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+# 编码好的 API 响应 (按最新样本的时间戳和配置版本生成 ETag) 和内存中的静态文件
+RESPONSES = ResponseCache()
+STATIC = StaticCache('templates')
 
 # 数据模型
 class Record(BaseModel):
@@ -41,162 +90,215 @@ class Record(BaseModel):
     memory_free: Union[float,None]  # 内存剩余量, 单位: MiB
     cuda_free: Union[List[float], None] # CUDA 显存剩余量, 单位: MiB
     cuda_per_user: Union[List[List[Union[str, int]]], None] = None # [gpu_id, username, memory_mib]
-
-def read_last_line(file_path, n=1):
-    if not os.path.exists(file_path): return None
-    return subprocess.check_output(['tail', '-n', str(n), file_path]).decode('utf-8')
-
+    # 以下字段仅在按分辨率汇总的历史数据中出现，此时上面的数值为桶内均值
+    resolution: Union[int, None] = None             # 汇总粒度, 单位: 秒
+    cpu_min: Union[float, None] = None
+    cpu_max: Union[float, None] = None
+    memory_min: Union[float, None] = None
+    memory_max: Union[float, None] = None
+    cuda_min: Union[List[Union[float, None]], None] = None
+    cuda_max: Union[List[Union[float, None]], None] = None
+
+# 每台主机最新一条记录的内存缓存，由后台任务在数据文件变化时更新
+LATEST = LatestCache(DATA_DIR, HOSTS)
+
+# 各主机硬件/系统信息的缓存 (data/info/{host}.json)，后台刷新
+SERVER_INFO = ServerInfoCache(POOL, DATA_DIR, HOSTS, executor=OFFLOAD.executors['ssh'])
+# 各主机磁盘用量报告的本地镜像 (data/disk/{host}/)，后台增量同步
+DISK_USAGE = DiskUsageMirror(POOL, DATA_DIR, HOSTS, executor=OFFLOAD.executors['ssh'])
+
+
+def __dashboard_row(data, mapping):
+    """ 把一条最新记录转换为 /api/dashboard 的输出格式 (与 Record 字段一致) """
+    data = normalize_record(dict(data))
+    cuda_per_user = data.get('cuda_per_user', [])
+    if cuda_per_user:
+        cuda_per_user = [[row[0], mapping.get(row[1], row[1]), row[2]] for row in cuda_per_user]
+    return dict(host=data['host'], timestamp=data['timestamp'],
+                cpu=data['cpu'], memory=data['memory'],
+                cuda=data['cuda'], cuda_free=data['cuda_free'],
+                user=None, cpu_free=data['cpu_free'], memory_free=data['memory_free'],
+                cuda_per_user=cuda_per_user)
 
 # 路由：获取所有服务器的最新数据
-@app.get("/api/dashboard", response_model=List[Record])
-async def get_dashboard():
+# 有新样本或配置变化前返回同一份缓存的响应，带 If-None-Match 的请求返回 304
+@app.get("/api/dashboard", response_model=List[Record], response_model_exclude_unset=True)
+async def get_dashboard(request: Request):
+    items = LATEST.items()
+    key = (tuple((host, data['timestamp']) for host, data in items), get_config_version())
+    build = lambda: dumps([__dashboard_row(data, get_mapping()) for host, data in items])
+    return RESPONSES.respond(request, 'dashboard', key, build)
+
+
+# 每台主机最新记录编码后的 SSE 事件，所有连接共用 (host -> (记录, 映射, 事件))
+__dashboard_events = {}
+
+def __dashboard_event(host, data, mapping):
+    cached = __dashboard_events.get(host)
+    if cached is None or cached[0] is not data or cached[1] is not mapping:
+        event = b'event: update\ndata: ' + dumps(__dashboard_row(data, mapping)) + b'\n\n'
+        cached = __dashboard_events[host] = (data, mapping, event)
+    return cached[2]
+
+# 路由：服务端推送 (Server-Sent Events) 的最新数据
+# 连接后先发送一次 snapshot (全部主机)，之后每台主机有新样本时发送 update (单台主机)；每 15 秒发送一次心跳注释
+@app.get("/api/dashboard/stream")
+async def stream_dashboard(request: Request):
+    async def events():
+        subscriber = LATEST.subscribe()
+        try:
+            mapping = get_mapping()
+            rows = [__dashboard_row(data, mapping) for host, data in LATEST.items()]
+            yield b'event: snapshot\ndata: ' + dumps(rows) + b'\n\n'
+            while not await request.is_disconnected():
+                try:
+                    hosts = await asyncio.wait_for(subscriber.wait(), timeout=15)
+                except TimeoutError:
+                    yield b': keepalive\n\n'
+                    continue
+                mapping = get_mapping()
+                for host in hosts:
+                    data = LATEST.get(host)
+                    if data is not None:
+                        yield __dashboard_event(host, data, mapping)
+        finally:
+            LATEST.unsubscribe(subscriber)
+    return StreamingResponse(events(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def __read_history_rollup(host: str, start: float, end: float, resolution: int) -> List[dict]:
+    """ 从汇总层读取覆盖 [start, end] 的时间桶 (字段与 Record 一致) """
+    data = rollup_store(host, resolution, DATA_DIR).read(start // resolution * resolution, end)
+    columns = {name: values.tolist() for name, values in data.items() if name != 'rows'}
+    width = (~np.isnan(data['cuda'])).sum(axis=1).tolist() if data['cuda'].ndim == 2 else [0] * len(columns['timestamp'])
+    nan_to_none = lambda values: [None if v != v else v for v in values]
     records = []
-    mapping = json.load(open('mapping.json', encoding='utf-8')) if os.path.exists('mapping.json') else {}
-    for host in HOSTS:
-        file_path = os.path.join(DATA_DIR, f'{host}.json')
-        if not os.path.exists(file_path): continue
-        data = json.loads(read_last_line(file_path))
-        if 'timestamp' not in data:
-            data['timestamp'] = time.mktime(time.strptime(data['time'], "%Y-%m-%d %H:%M:%S"))
-        if 'cpu-free' not in data: data['cpu-free'] = None
-        if 'memory-free' not in data: data['memory-free'] = None
-        cuda_per_user = data.get('cuda_per_user', [])
-        if cuda_per_user:
-            cuda_per_user = [[row[0], mapping.get(row[1], row[1]), row[2]] for row in cuda_per_user]
-        records.append(Record(host=data['host'], timestamp=data['timestamp'],
-                              cpu=data['cpu'], memory=data['memory'],
-                              cuda=data['cuda'], cuda_free=data['cuda-free'],
-                              user=None, cpu_free=data['cpu_free'], memory_free=data['memory_free'],
-                              cuda_per_user=cuda_per_user))
+    for i, timestamp in enumerate(columns['timestamp']):
+        cuda = lambda name: nan_to_none(columns[name][i][:width[i]]) if width[i] else []
+        records.append(dict(timestamp=timestamp, host=host, user=None,
+                            cpu=columns['cpu'][i], memory=columns['memory'][i], cuda=cuda('cuda'),
+                            cpu_free=nan_to_none([columns['cpu_free'][i]])[0],
+                            memory_free=nan_to_none([columns['memory_free'][i]])[0],
+                            cuda_free=cuda('cuda_free'), resolution=resolution,
+                            cpu_min=columns['cpu_min'][i], cpu_max=columns['cpu_max'][i],
+                            memory_min=columns['memory_min'][i], memory_max=columns['memory_max'][i],
+                            cuda_min=cuda('cuda_min'), cuda_max=cuda('cuda_max')))
     return records
 
-
-def __get_timestamp_from_line(line: str) -> float:
-    """
-    从一行 JSON 字符串里提取 timestamp。如果没有 'timestamp' 字段，
-    就用 time.strptime + time.mktime 解析 'time' 字段。
-    """
-    data = json.loads(line)
-    if 'timestamp' not in data:
-        # 假设 time 格式都是 "%Y-%m-%d %H:%M:%S"
-        data['timestamp'] = time.mktime(time.strptime(data['time'], "%Y-%m-%d %H:%M:%S"))
-    return float(data['timestamp'])
-
-def __find_start_offset(file_path: str, start_ts: float) -> int:
-    """
-    在 sorted-by-timestamp 的文件里，使用二分查找来定位第一个 timestamp >= start_ts 的“附近”字节偏移。
-    返回值是一个 file.seek() 可以使用的字节偏移位置，我们会在此偏移再做一次 readline() 丢掉残行。
-    """
-    file_size = os.path.getsize(file_path)
-    low, high = 0, file_size
-    result_offset = 0
-
-    with open(file_path, 'r', encoding='utf-8') as f:
-        while low <= high:
-            mid = (low + high) // 2
-            f.seek(mid)
-
-            # 丢弃当前这一行的不完整部分
-            f.readline()
-            line = f.readline()
-            if not line:
-                # 如果 mid 已经靠近文件末尾，往前移动高位
-                high = mid - 1
-                continue
-
-            try:
-                ts = __get_timestamp_from_line(line)
-            except Exception:
-                # 如果 JSON 解析失败，就往后或往前稍微移动一点再试
-                # 这里简单起见，把 mid 往后调一点
-                low = mid + 1
-                continue
-
-            if ts < start_ts:
-                # 目标在文件后半段
-                low = mid + 1
-            else:
-                # ts >= start_ts，记住这个位置有可能是我们要的“起点”
-                result_offset = mid
-                high = mid - 1
-
-    return result_offset
-
 # 路由：获取指定服务器的历史数据
-@app.get("/api/history", response_model=List[Record])
-async def get_history(host: str, start: float, end: float):
+# resolution: 期望的时间粒度 (秒)；max_points: 返回点数上限。二者都不指定时返回原始数据
+# stream: 为 true 时边读边编码，直接以 JSON 数组流式返回，内存占用与时间范围无关
+# format: rows (默认, 每条记录一个对象) / columnar (每个指标一个数组) /
+#         binary (小端二进制: n 个 float64 时间戳, 之后按响应头 X-Series 的顺序每个序列 n 个 float32)
+# per_user: columnar 格式是否附带每行的 cuda_per_user (默认不带，只有数值序列)
+@app.get("/api/history", response_model=List[Record], response_model_exclude_unset=True)
+async def get_history(request: Request, host: str, start: float, end: float,
+                      resolution: Optional[int] = None, max_points: Optional[int] = None,
+                      stream: bool = False, fmt: str = Query('rows', alias='format'), per_user: bool = False):
+    if fmt not in ('rows', 'columnar', 'binary'):
+        raise HTTPException(status_code=400, detail=f"Unknown format: {fmt}")
+    if host not in HOSTS: return __empty_history(fmt)
+    accept_gzip = 'gzip' in request.headers.get('accept-encoding', '')
+    return await offload('history', __read_history, host, start, end, resolution, max_points, stream, fmt, per_user, accept_gzip)
+
+
+def __empty_history(fmt):
+    """ 没有数据 (未知主机或尚无数据文件) 时按请求的格式返回空结果 """
+    if fmt == 'rows':
+        return Response(content=b'[]', media_type='application/json')
+    columns = {'timestamp': np.empty(0, dtype='<f8')}
+    columns.update({name: np.empty((0, 0) if name in ('cuda', 'cuda_free') else 0, dtype='<f4') for name in SERIES})
+    if fmt == 'columnar':
+        return Response(content=dumps(to_json(columns)), media_type='application/json')
+    body, names = to_binary(columns)
+    return Response(content=body, media_type='application/octet-stream', headers={'X-Rows': '0', 'X-Series': ','.join(names)})
+
+
+def __json_response(body, accept_gzip):
+    """ 较大的 JSON 在线程池中压缩好再返回 (GZipMiddleware 跳过已压缩的响应)，避免在事件循环中压缩数 MB 的数据 """
+    if accept_gzip and len(body) >= 1 << 16:
+        return Response(content=gzip.compress(body, 6), media_type='application/json',
+                        headers={'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'})
+    return Response(content=body, media_type='application/json')
+
+
+def __read_history(host, start, end, resolution, max_points, stream, fmt, per_user=False, accept_gzip=False):
+    """ /api/history 的阻塞部分 (在线程池中执行)；直接返回编码好的 Response，不在事件循环中做 pydantic 序列化 """
     file_path = os.path.join(DATA_DIR, f'{host}.json')
-    if host not in HOSTS or not os.path.exists(file_path): return []
-    records = []
+    if not os.path.exists(file_path):
+        return __empty_history(fmt)
     # 加载用户映射
-    mapping = json.load(open('mapping.json', encoding='utf-8')) if os.path.exists('mapping.json') else {}
-
-    # 1. 先用二分查找定位到“起点偏移”
-    start_offset = __find_start_offset(file_path, start)
-
-    with open(file_path, 'r', encoding='utf-8') as f:
-        # 2. 把文件指针移动到 start_offset 处，再丢掉这一行的不完整部分
-        f.seek(start_offset)
-        f.readline()
+    mapping = get_mapping()
+
+    store = column_store(host, DATA_DIR)
+    if store.exists():
+        # 如果已有列式存储 (由 monitor.py 维护)，直接按列读取
+        resolution = choose_resolution(host, start, end, DATA_DIR, resolution=resolution, max_points=max_points)
+    else:
+        resolution = 0
+
+    if fmt != 'rows':
+        # 各用户明细只在 columnar 格式且请求了 per_user 时读取 (二进制格式只含数值序列)
+        columns = read_columns(host, start, end, file_path, DATA_DIR, mapping, resolution,
+                               per_user=(fmt == 'columnar' and per_user))
+        if fmt == 'columnar':
+            return __json_response(dumps(to_json(columns)), accept_gzip)
+        body, names = to_binary(columns)
+        return Response(content=body, media_type='application/octet-stream',
+                        headers={'X-Rows': str(len(columns['timestamp'])), 'X-Series': ','.join(names)})
+
+    if resolution > 0:
+        return __json_response(dumps(__read_history_rollup(host, start, end, resolution)), accept_gzip)
+    if store.exists():
+        rows = iter_column_rows(store, host, start, end, mapping)
+    else:
+        # 否则借助时间索引读取 JSONL 中 [start, end] 的部分
+        rows = iter_jsonl_rows(file_path, host, start, end, mapping)
+
+    if stream:
+        # 边读边编码；迭代在响应发送时进行，同样受 history 端点的并发上限和超时限制
+        return StreamingResponse(OFFLOAD.stream('history', stream_json_array(rows)), media_type='application/json')
+    # 跳过 pydantic 的构造、校验和再次序列化
+    return __json_response(dumps(list(rows)), accept_gzip)
+
+# 路由：跨主机的历史数据聚合，例如全集群过去一周的空闲显存总量、CPU 使用率 p95
+# hosts: 逗号分隔的主机名，默认为全部主机；metric: cpu / memory / cpu_free / memory_free / cuda / cuda_free；
+# step: 时间网格的间隔 (秒)。按 GPU 的指标先在主机内合并 (cuda_free 求和, cuda 取平均)
+@app.get("/api/fleet_history")
+async def get_fleet_history(metric: str, start: float, end: float, step: int = 600,
+                            hosts: Optional[str] = None, per_host: bool = False):
+    hosts = hosts.split(',') if hosts else list(HOSTS)
+    unknown = [host for host in hosts if host not in HOSTS]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Host not found: {','.join(unknown)}")
+    if metric not in SERIES:
+        raise HTTPException(status_code=400, detail=f"Unknown metric: {metric}")
+    if step <= 0 or (end - start) / step > 100000:
+        raise HTTPException(status_code=400, detail="Invalid step")
+    return Response(content=await offload('fleet_history', __read_fleet_history, hosts, metric, start, end, step, per_host),
+                    media_type='application/json')
+
+
+def __read_fleet_history(hosts, metric, start, end, step, per_host):
+    hosts = [host for host in hosts if os.path.exists(os.path.join(DATA_DIR, f'{host}.json'))]
+    grid, matrix, aggregates = fleet_history(hosts, metric, start, end, step, DATA_DIR)
+    return dumps(fleet_to_json(hosts, grid, matrix, aggregates, per_host))
 
-        # 3. 从此处开始顺序读取，碰到 timestamp > end 就直接中止
-        for line in f:
-            try:
-                data = json.loads(line)
-
-                # 如果没有 'timestamp'，补充计算一下
-                if 'timestamp' not in data:
-                    data['timestamp'] = time.mktime(time.strptime(data['time'], "%Y-%m-%d %H:%M:%S"))
-                # 补齐可能缺失的字段
-                if 'cpu-free' not in data:      data['cpu-free'] = None
-                if 'memory-free' not in data:   data['memory-free'] = None
-
-                ts = float(data['timestamp'])
-
-                # 如果读到的记录还没到 start，直接跳过
-                if ts < start:
-                    continue
-
-                # 如果超过 end，就可以停止整个循环
-                if ts > end:
-                    break
-                
-                # 处理 cuda_per_user 字段
-                cuda_per_user = data.get('cuda_per_user', [])
-                if cuda_per_user:
-                    cuda_per_user = [[row[0], mapping.get(row[1], row[1]), row[2]] for row in cuda_per_user]
-
-                # ts 在 [start, end] 区间内，就 append 到结果
-                records.append(
-                    Record(
-                        host=host,
-                        timestamp=ts,
-                        cpu=data['cpu'],
-                        memory=data['memory'],
-                        cuda=data['cuda'],
-                        cuda_free=data.get('cuda-free'),
-                        user=None,
-                        cpu_free=data.get('cpu-free'),
-                        memory_free=data.get('memory-free'),
-                        cuda_per_user=cuda_per_user,
-                    )
-                )
-            except Exception as e:
-                # 如果某行解析失败，打印一下日志并跳过
-                logger.error(f"parse error: {e}  --  line: {line.strip()}")
-                continue
+# 路由：获取按用户汇总的资源使用情况
+@app.get("/api/summary", response_model=List[Record], response_model_exclude_unset=True)
+async def get_summary(request: Request, host: str):
+    data = LATEST.get(host) if host in HOSTS else None
+    if data is None:
+        return []
+    key = (data['timestamp'], get_config_version())
+    return RESPONSES.respond(request, f'summary:{host}', key, lambda: dumps(__summary_rows(host, data)))
 
-    return records
 
-# 路由：获取按用户汇总的资源使用情况
-@app.get("/api/summary", response_model=List[Record])
-async def get_summary(host: str):
+def __summary_rows(host, data):
+    """ 按用户汇总一条最新记录 (字段与 Record 一致) """
     records = []
-    mapping = json.load(open('mapping.json', encoding='utf-8')) if os.path.exists('mapping.json') else {}
-    file_path = os.path.join(DATA_DIR, f'{host}.json')
-    if host not in HOSTS or not os.path.exists(file_path):
-        return []
-    data = json.loads(read_last_line(file_path))
+    mapping = get_mapping()
     user2cpu = {}
     for user, value in data['cpu_per_user']: user2cpu[user] = user2cpu.get(user, 0.0) + value
     user2mem = {}
@@ -206,23 +308,51 @@ async def get_summary(host: str):
         if user not in user2cuda: user2cuda[user] = [0.0] * len(data['cuda'])
         user2cuda[user][int(cuda.removeprefix('cuda:'))] += value
     users = set(user2cpu.keys()) | set(user2mem.keys()) | set(user2cuda.keys())
+    ignored_users = get_ignored_users()
     for user in users:
         if user.startswith('PID'): continue # ignore unknown username
-        if user in [ # ignore system users
-            'www-data', 'root', 'nobody', 'messagebus', 'syslog', 
-            'systemd-timesync', 'earlyoom', 'uuidd', 'colord', 'postfix', '_rpc', 
-            'postgres', 'systemd-resolve', 'nvidia-persistenced', 
-            'systemd-network', 'whoopsie', 'kernoops', 'systemd-oom',
-            'Debian-snmp', 'daemon', 'mas', 'libvirt-dnsmasq', 'rtkit', 'lp', 'avahi', 'zabbix', 'gdm'
-        ]: continue
-        records.append(Record(host=host, timestamp=data['timestamp'],
-                                cpu=user2cpu.get(user, 0.0), memory=user2mem.get(user, 0.0),
-                                cuda=user2cuda.get(user, [0.0] * len(data['cuda'])), 
-                                cuda_free=None, user=mapping.get(user, user),
-                                cpu_free=None, memory_free=None))
+        if user in ignored_users: continue # ignore system users
+        records.append(dict(timestamp=data['timestamp'], host=host, user=mapping.get(user, user),
+                            cpu=user2cpu.get(user, 0.0), memory=user2mem.get(user, 0.0),
+                            cuda=user2cuda.get(user, [0.0] * len(data['cuda'])),
+                            cpu_free=None, memory_free=None, cuda_free=None, cuda_per_user=None))
     return records
 
 
+class UsageRecord(BaseModel):
+    host: Union[str, None]          # 主机名, 按用户汇总全部主机时为 None
+    user: str                       # 用户名
+    core_hours: float               # CPU 核时
+    gpu_hours: float                # GPU 卡时 (有进程占用即计入)
+    gpu_memory_gib_hours: float     # 显存用量, 单位: GiB·h
+
+# 路由：按用户统计 [start, end] (YYYY-MM-DD, 含两端) 内的资源用量
+# host 为空时统计全部主机；fleet=true 时把各主机的用量按用户合并
+@app.get("/api/usage", response_model=List[UsageRecord])
+async def get_usage(start: str, end: str, host: Optional[str] = None, fleet: bool = False):
+    # 日期按字符串比较，统一为补零的 YYYY-MM-DD
+    try:
+        start, end = (time.strftime('%Y-%m-%d', time.strptime(day, '%Y-%m-%d')) for day in (start, end))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid date (expected YYYY-MM-DD): {str(e)}")
+    if start > end:
+        raise HTTPException(status_code=422, detail=f"start ({start}) is after end ({end})")
+    if host is not None and host not in HOSTS:
+        raise HTTPException(status_code=404, detail="Host not found")
+    mapping = get_mapping()
+    usage = await offload('usage', query_usage, [host] if host else list(HOSTS), start, end, DATA_DIR)
+    rows = {}
+    for host_name, users in usage.items():
+        for user, value in users.items():
+            key = (None if fleet else host_name, mapping.get(user, user))
+            if key not in rows:
+                rows[key] = dict.fromkeys(value, 0.0)
+            for field, amount in value.items():
+                rows[key][field] += amount
+    records = [UsageRecord(host=key[0], user=key[1], **value) for key, value in rows.items()]
+    return sorted(records, key=lambda r: (-r.gpu_hours, -r.core_hours))
+
+
 class DiskUsageRecord(BaseModel):
     host: str             # 主机名
     time: float             # 时间戳
@@ -231,53 +361,27 @@ class DiskUsageRecord(BaseModel):
     free: float             # 剩余容量字节数
     usage: Dict[str, float] # 用户使用字节数
 
-# 路由：获取用户磁盘用量
+# 路由：获取用户磁盘用量（来自本地镜像，后台增量同步）
 @app.get("/api/disk", response_model=List[DiskUsageRecord])
 async def get_disk(host: str):
     if host not in HOSTS:
         raise HTTPException(status_code=404, detail="Host not found")
-    mapping = json.load(open('mapping.json', encoding='utf-8')) if os.path.exists('mapping.json') else {}
-
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    try:
-        ssh.connect(**HOSTS[host], timeout=10)
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to connect to host: {str(e)}")
-
-    # _, stdout, _ = ssh.exec_command("df -B1 | grep '^/dev' | grep ' /data' | awk '{total[$6] += $2/1024/1024/1024; free[$6] += $4/1024/1024/1024} END {for (u in total) print u, total[u], free[u]}'")
-    # output = stdout.read().decode()
-    # df = pd.DataFrame([line.split() for line in output.splitlines()], columns=['disk', 'total', 'free'])
-    # df['total'] = df['total'].astype(float)
-    # df['free'] = df['free'].astype(float)
-    # df = df.set_index('disk').sort_index()
-
-    sftp = ssh.open_sftp()
-    with sftp.file('/var/monitor-disk-usage/202510.jsonl', 'r') as f:
-        raw_text = f.read().decode()
-    df = pd.read_json(StringIO(raw_text), lines=True)
-    df['disk'] = df['path'].str.rsplit('/', n=1).str[0]
-    df['user'] = df['path'].str.rsplit('/', n=1).str[1]
-    df['size'] = df['size']/1024/1024/1024
-    df['user'] = df['user'].apply(lambda x: mapping.get(x, x))
-
-    time = df['time'].max()
-    # df = df[df['time'] == time].reset_index()
-    df = df.drop_duplicates(subset=['disk', 'user'], keep='last')
-
-    result = []
-    for disk, group in df.groupby('disk'):
-        _, stdout, _ = ssh.exec_command(f"df -B1 \"{disk}\" | awk 'NR==2{{print $2/1024/1024/1024, $4/1024/1024/1024}}'")
-        output = stdout.read().decode()
-        total, free = output.strip().split()
-        
-        result.append(DiskUsageRecord(host=host, time=time,
-                                      disk=disk, total=total, free=free,
-                                      usage=group.set_index('user')['size'].to_dict()
-                                      ))
-    return result
+    mapping = get_mapping()
 
+    result = DISK_USAGE.get(host)
+    if result is None:
+        # 尚未同步过 (刚启动)，在线程中同步一次
+        try:
+            await offload('disk', DISK_USAGE.refresh, host)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to read disk usage: {str(e)}")
+        result = DISK_USAGE.get(host)
+    disks, updated = result
+    return [DiskUsageRecord(host=host, time=updated, disk=disk, total=total, free=free,
+                            usage={mapping.get(user, user): size for user, size in usage.items()})
+            for disk, total, free, usage in disks]
 
 
 class PortRecord(BaseModel):
@@ -299,24 +403,27 @@ async def get_ports(host: str, secret: str):
 
     if host not in HOSTS:
         raise HTTPException(status_code=404, detail="Host not found")
+    return await offload('ports', __read_ports, host)
+
+
+def __read_ports(host):
+    """ /api/ports 的阻塞部分 (在线程池中执行) """
     timestamp = time.time()
-    mapping = json.load(open('mapping.json', encoding='utf-8')) if os.path.exists('mapping.json') else {}
+    mapping = get_mapping()
 
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    root = dict(username='root', key_filename='/home/yumeow/.ssh/LABNAS/id_rsa')
     try:
-        ssh.connect(**{**HOSTS[host], 'username': 'root', 'key_filename': '/home/yumeow/.ssh/LABNAS/id_rsa'})
+        POOL.get(host, **root)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to connect to host: {str(e)}")
 
-    _, stdout, _ = ssh.exec_command("ps -eo user:100,pid | awk 'NR > 1'")
+    output = POOL.exec(host, "ps -eo user:100,pid | awk 'NR > 1'", **root)
     pid2user = {}
-    for line in stdout.read().decode().splitlines():
+    for line in output.splitlines():
         user, pid = line.split()
         pid2user[pid] = user
 
-    _, stdout, _ = ssh.exec_command("netstat -tunlp | awk 'NR > 2 {print $4, $7}' | sort | uniq")
-    data = stdout.read().decode()
+    data = POOL.exec(host, "netstat -tunlp | awk 'NR > 2 {print $4, $7}' | sort | uniq", **root)
 
     result = []
     for line in data.splitlines():
@@ -337,6 +444,11 @@ async def get_ports(host: str, secret: str):
 # 路由：返回服务器 IP
 @app.get("/api/ip")
 async def get_ip(host: str, secret: str):
+    return await offload('ip', __read_ip, host, secret)
+
+
+def __read_ip(host, secret):
+    """ /api/ip 的阻塞部分 (读取密钥文件、DNS 解析) """
     with open('./keys/TOTP', 'r') as f:
         base32secret = f.read().strip()
     totp = pyotp.TOTP(base32secret, interval=30, digits=6)
@@ -352,140 +464,57 @@ async def get_ip(host: str, secret: str):
 
 # 路由：返回支持的主机列表 (List[str])
 @app.get("/api/hosts", response_model=List[str])
-async def get_hosts():
-    return list(HOSTS.keys())
+async def get_hosts(request: Request):
+    return RESPONSES.respond(request, 'hosts', tuple(HOSTS), lambda: dumps(list(HOSTS.keys())))
 
 
-# 路由：获取指定服务器的硬件/系统详情（通过 SSH 上传并执行 get_server_info.py）
+# 路由：获取指定服务器的硬件/系统详情（来自缓存，refresh=true 时重新探测）
 @app.get("/api/server_info", response_class=PlainTextResponse)
-async def get_server_info(host: str):
+async def get_server_info(host: str, refresh: bool = False):
     if host not in HOSTS:
         raise HTTPException(status_code=404, detail="Host not found")
     try:
-        ssh = ssh_connect(HOSTS[host])
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to connect to host: {str(e)}")
-
-    try:
-        info = {}
-        # Hostname
-        info["💻 Hostname"] = safe_exec_command(ssh, "hostname -f 2>/dev/null || hostname").strip()
-        # CPU Model
-        info["🧠 CPU Model"] = safe_exec_command(ssh, "lscpu | grep 'Model name' | awk -F: '{print $2}'").strip()
-        # Cores / Threads
-        physical = safe_exec_command(ssh, "grep 'core id' /proc/cpuinfo | sort -u | wc -l").strip()
-        logical = safe_exec_command(ssh, "nproc").strip()
-        info["⚙️ Cores / Threads"] = f"{physical} C / {logical} T"
-        # CPU Frequency
-        output = safe_exec_command(ssh, "lscpu | grep 'MHz'").strip()
-        frequency = {}
-        for line in output.splitlines():
-            k, v = line.split(':')
-            frequency[k.strip()] = v.strip()
-        freq = frequency.get('CPU MHz', 'N/A')
-        if freq == 'N/A':
-            output2 = safe_exec_command(ssh, "cat /sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq").strip()
-            freq = int(output2) / 1024 # kHz -> MHz
-        else:
-            freq = float(freq)
-        freq_min = float(frequency.get('CPU min MHz', 'N/A'))
-        freq_max = float(frequency.get('CPU max MHz', 'N/A'))
-        info["⏱️ CPU Frequency"] = f"{freq:.2f} MHz (min={freq_min:.0f} MHz, max={freq_max:.0f} MHz)"
-        # SIMD Support
-        output = safe_exec_command(ssh, "grep '^flags' /proc/cpuinfo | head -n 1").strip()
-        flags = set(output.split(':', 2)[1].split())
-        info["🧩 SIMD Support"] = f"AVX={'avx' in flags}, AVX2={'avx2' in flags}, AVX512={any('avx512f' in f for f in flags)}"
-        # L3 Cache
-        info["🗃️ L3 Cache"] = safe_exec_command(ssh, "lscpu | grep 'L3 cache' | awk -F: '{print $2}'").strip()
-        # NUMA Nodes
-        info["🔀 NUMA Nodes"] = safe_exec_command(ssh, "lscpu | grep 'NUMA node(s)' | awk -F: '{print $2}'").strip()
-        # Total Memory
-        output = safe_exec_command(ssh, 'cat /proc/meminfo').strip()
-        lines = [line for line in output.splitlines() if 'MemTotal' in line]
-        assert len(lines) == 1, output
-        mem_kB = int(lines[0].removeprefix('MemTotal:').strip().removesuffix('kB').strip())
-        info["💾 Memory Total"] = f"{mem_kB / 1024 / 1024:.0f} GB"
-        # GPU Model
-        output = safe_exec_command(ssh, "nvidia-smi --query-gpu=name,memory.total --format=csv,noheader").strip()
-        try:
-            df = pd.read_csv(StringIO(output), sep=',', names=['Name', 'Memory'])
-            df['Name'] = df['Name'].str.strip()
-            df['Memory'] = df['Memory'].str.strip()
-            gpu_model = ""
-            for name in df['Name'].unique():
-                if gpu_model != "":
-                    gpu_model += ", "
-                count = (df['Name'] == name).sum()
-                mem_MB = df.loc[df['Name'] == name, 'Memory'].iloc[0]
-                mem_GB = int(mem_MB.removesuffix('MiB').strip()) / 1024
-                gpu_model += f"{count}*{name} ({mem_GB:.0f} GiB) "
-            if gpu_model == "":
-                gpu_model = "N/A"
-        except Exception:
-            gpu_model = f"N/A ({output})"
-        info["🎮 GPU Model"] = gpu_model
-        # CUDA Version
-        info["🚀 CUDA Version"] = safe_exec_command(ssh, "nvidia-smi | grep -i 'CUDA Version' | head -n1 | awk -F 'CUDA Version: ' '{print $2}' | awk '{print $1}'").strip() or "N/A"
-        # OS Version
-        output = safe_exec_command(ssh, 'cat /etc/os-release').strip()
-        lines = [line for line in output.splitlines() if 'PRETTY_NAME' in line]
-        assert len(lines) == 1, output
-        info["🐧 OS Version"] = lines[0].strip().removeprefix('PRETTY_NAME=').strip('"')
-        # Kernel Version
-        info["🧱 Kernel Version"] = safe_exec_command(ssh, "uname -a").strip()
-        # Conclude
-        max_len = max(len(k) for k in info)
-        content = '\n'.join([f"{k:{max_len}} : {v}" for k, v in info.items()])
-        max_len = max(map(len, content.splitlines()))
-        content = (
-            '=' * max_len + '\n' +
-            '🔍 Server Hardware Info Summary\n' +
-            '=' * max_len + '\n' +
-            content + '\n' +
-            '=' * max_len
-        )
-        return PlainTextResponse(content=content)
+        entry = await OFFLOAD.wait('server_info', SERVER_INFO.get(host, refresh))
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out: server_info")
     except Exception as e:
         return PlainTextResponse(content=(
             f"Error retrieving server info: [{type(e)}] {e}\n"
             f"{traceback.format_exc()}"
         ), status_code=500)
-    finally:
-        ssh.close()
+    return PlainTextResponse(content=format_server_info(entry['info'], entry['timestamp']))
 
 
-# 路由：返回前端HTML页面
+# 路由：返回前端HTML页面 (页面与静态文件都从内存返回，见 StaticCache)
 @app.get("/", response_class=HTMLResponse)
-async def index():
-    with open("templates/index.html", encoding='utf-8') as f:
-        return HTMLResponse(content=f.read())
+async def index(request: Request):
+    return STATIC.respond(request, "templates/index.html")
 
 
 @app.get("/css/{filename}")
-async def get_css(filename: str):
-    return FileResponse(f"templates/css/{filename}")
+async def get_css(request: Request, filename: str):
+    return STATIC.respond(request, f"templates/css/{filename}")
 
 
 @app.get("/js/{filename}")
-async def get_js(filename: str):
-    return FileResponse(f"templates/js/{filename}")
+async def get_js(request: Request, filename: str):
+    return STATIC.respond(request, f"templates/js/{filename}")
 
 @app.get("/html/{filename}")
-async def get_js(filename: str):
-    return FileResponse(f"templates/html/{filename}")
+async def get_html(request: Request, filename: str):
+    return STATIC.respond(request, f"templates/html/{filename}")
 
 
 # 详情页 HTML
 @app.get("/server", response_class=HTMLResponse)
-async def server_page():
-    with open("templates/server.html", encoding='utf-8') as f:
-        return HTMLResponse(content=f.read())
+async def server_page(request: Request):
+    return STATIC.respond(request, "templates/server.html")
 
 
 # 路由：获取图标 ./assets/favicon.ico
 @app.get("/favicon.ico")
-async def get_favicon():
-    return FileResponse("assets/favicon.ico")
+async def get_favicon(request: Request):
+    return STATIC.respond(request, "assets/favicon.ico")
 
 
 if __name__ == '__main__':
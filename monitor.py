@@ -1,58 +1,195 @@
 import os
 import yaml
 import time
-import json
 import dotenv
-import threading
+import asyncio
+import numpy as np
 import traceback
 from logging import getLogger
+from concurrent.futures import ThreadPoolExecutor
 from src.logger import set_logger
-from src.ssh_connect import ssh_connect
+from src.ssh_pool import SSHPool
+from src.storage import column_store, import_jsonl
+from src.rollup import update_rollups
+from src.time_index import TimeIndex
+from src.accounting import UsageAccumulator, catch_up_usage
+from src.writer import RecordWriter, repair_tail
+from src.segments import host_segments
+from src.scheduler import INTERVALS, CommandBudget, AdaptiveInterval
 from src.monitor import get_cpu_stats, get_memory_stats, get_cuda_stats
+from src.monitor import parse_cpu_stats, parse_memory_stats, parse_cuda_stats
+from src.monitor import BATCH_COMMANDS, discover, exec_sample
 
 dotenv.load_dotenv()
 
 
-def monitor_server(host, server_config, interval=30, save_path='./data', patience=10):
-    os.makedirs(save_path, exist_ok=True)
+def sample_server(pool, host, state, batch=True, timeout=60):
+    """
+    对 host 采样一次 (阻塞调用，在线程池中执行)
+    batch=True 时每次采样只执行一条合并后的命令 (见 src/monitor/get_batch.py)，
+    其中 CPU 核数、GPU 列表等静态信息缓存在 state['capability'] 中，过期或拓扑变化时才重新探测
+    """
+    logger = getLogger(f'my.{host}')
+    ssh = pool.get(host)
+    record = dict(timestamp=time.time())
+    if batch:
+        capability = state.get('capability')
+        if capability is None or capability.expired():
+            outputs, state['capability'] = discover(ssh, timeout=timeout)
+        else:
+            outputs = exec_sample(ssh, capability, timeout=timeout)
+        record.update(parse_cpu_stats(outputs, state))
+        record.update(parse_memory_stats(outputs))
+    else:
+        record.update(get_cpu_stats(ssh, state))
+        record.update(get_memory_stats(ssh))
+    # GPU 部分 (含拓扑变化后的重新发现) 出错时，仍保留 CPU 和内存数据
+    try:
+        if not batch:
+            record.update(get_cuda_stats(ssh))
+        else:
+            if not state['capability'].matches(outputs):
+                logger.info(f"GPU topology of {host} changed, rediscovering")
+                outputs, state['capability'] = discover(ssh, timeout=timeout)
+            capability = state['capability']
+            if capability.has_gpu or not capability.outputs['cuda_lspci']:
+                record.update(parse_cuda_stats(outputs))
+            else:
+                # lspci 有 GPU 但 nvidia-smi 没有可解析的输出：按没有 GPU 记录，档案到期后重新探测
+                record.update({'cuda': [], 'cuda-free': [], 'cuda_per_user': []})
+                if 'cuda' in outputs:
+                    logger.warning(f"nvidia-smi returned no GPU in {host}: {outputs['cuda_uuid'].strip()[:200]}")
+    except Exception as e:
+        record.update({'cuda': [], 'cuda-free': [], 'cuda_per_user': []})
+        state.pop('capability', None)  # 下次采样重新探测
+        logger.error(
+            f"Failed to get CUDA stats in {host}: "
+            f"[{type(e)}] {e}\n"
+            f"{traceback.format_exc()}"
+        )
+    record['host'] = host
+    return record
+
+
+def catch_up(save_path, host):
+    """
+    整理 JSONL 分段 (截掉末尾写了一半的行，把跨越多天的旧文件拆分为按天的分段)，
+    再把时间索引、列式存储、各级汇总和用户用量统计追平 JSONL
+    (首次运行时即一次性导入并回填全部历史)，返回该主机的 UsageAccumulator
+    """
     path = os.path.join(save_path, f'{host}.json')
+    store = column_store(host, save_path)
+    segments = host_segments(host, save_path)
+    segments.recover()
+    if os.path.exists(path):
+        repair_tail(path)
+        segments.split()
+        TimeIndex(path).build()
+    last = store.last_timestamp()
+    for file_path in segments.files(start=-np.inf if last is None else last):
+        import_jsonl(file_path, store)
+    update_rollups(store, host, save_path)
+    return catch_up_usage(host, save_path)
+
+
+def compact_segments(save_path, host, compress_after=86400, retention=None):
+    """
+    压缩/删除已导入列式存储的旧分段 (见 Segments.compact)；
+    设置了 retention 时同样截断列式存储中的原始数据 (各级汇总保留全部历史)
+    """
+    store = column_store(host, save_path)
+    last = store.last_timestamp()
+    host_segments(host, save_path).compact(-np.inf if last is None else last, compress_after, retention)
+    if retention is not None:
+        store.trim(time.time() - retention)
+
+
+async def compact_all(hosts, executor, save_path='./data', compress_after=86400, retention=None, interval=3600):
+    """ 后台任务：每隔 interval 秒逐台整理已封存的分段 """
+    logger = getLogger('my.segments')
+    loop = asyncio.get_running_loop()
+    while True:
+        for host in hosts:
+            try:
+                await loop.run_in_executor(executor, compact_segments, save_path, host, compress_after, retention)
+            except Exception as e:
+                logger.error(f"Failed to compact segments of {host}: [{type(e)}] {e}")
+        await asyncio.sleep(interval)
+
+
+async def monitor_server(host, pool, executor, budget, writer, intervals=INTERVALS, save_path='./data', patience=10, batch=True, timeout=60):
+    """
+    单台主机的采样循环。所有主机共用一个事件循环、一个有界线程池、一个 SSH 命令预算 (budget) 和一个写入线程 (writer)；
+    采样间隔在 intervals 之间自适应 (见 AdaptiveInterval)，采样时刻对齐到当前间隔的整数倍 (共享时钟)，
+    单次采样超过 timeout 秒视为失败
+    """
+    os.makedirs(save_path, exist_ok=True)
     logger = getLogger(f'my.{host}')
+    loop = asyncio.get_running_loop()
+    state = {}  # 跨采样保存的计数器等状态 (见 parse_cpu_stats)
+    schedule = AdaptiveInterval(intervals)
+    cost = 1 if batch else len(BATCH_COMMANDS)  # 每次采样执行的命令数
+    try:
+        usage = await loop.run_in_executor(executor, catch_up, save_path, host)
+    except Exception as e:
+        # 派生数据落后不影响采样，下次启动时再追平
+        usage = UsageAccumulator(host, save_path)
+        logger.error(
+            f"Failed to catch up {host}: "
+            f"[{type(e)}] {e}\n"
+            f"{traceback.format_exc()}"
+        )
     cnt = patience
     while cnt > 0:
+        await asyncio.sleep(schedule.interval - time.time() % schedule.interval)
+        await budget.acquire(cost)
         try:
-            ssh = ssh_connect(server_config)
+            record = await asyncio.wait_for(
+                loop.run_in_executor(executor, sample_server, pool, host, state, batch, timeout),
+                timeout=timeout + 30,  # 留出建立连接的时间
+            )
+            writer.submit(record, usage)
             cnt = patience
-            while True:
-                record = dict(timestamp=time.time())
-                record.update(get_cpu_stats(ssh))
-                record.update(get_memory_stats(ssh))
-                try:
-                    record.update(get_cuda_stats(ssh))
-                except Exception as e:
-                    record.update({'cuda': [], 'cuda-free': [], 'cuda_per_user': []})
-                    logger.error(
-                        f"Failed to get CUDA stats in {host}: "
-                        f"[{type(e)}] {e}\n"
-                        f"{traceback.format_exc()}"
-                    )
-                record['host'] = host
-                with open(path, 'a') as f: 
-                    f.write(json.dumps(record) + '\n')
-                # logger.debug(' | '.join([f"{k}: {v}" for k, v in record.items()]))
-                time.sleep(interval)
+            interval = schedule.interval
+            if schedule.update(record) != interval:
+                logger.debug(f"Sampling interval of {host}: {interval}s -> {schedule.interval}s")
         except Exception as e:
             cnt -= 1
+            pool.discard(host)
+            state.pop('capability', None)
             logger.error(
                 f"Failed to connect to {host}: "
                 f"[{type(e)}] {e}\n"
                 f"{traceback.format_exc()}"
             )
-            time.sleep(60)
+            await asyncio.sleep(60)
+
+
+async def monitor_all(hosts, max_workers=32, commands_per_second=10.0, flush_interval=1.0, fsync=False,
+                      compress_after=86400, retention=None, **kwargs):
+    """
+    用一个事件循环调度所有主机，max_workers 限制同时进行的 SSH 采样数，
+    commands_per_second 限制整个集群每秒执行的 SSH 命令数；
+    样本由一个写入线程分组写盘，最多延迟 flush_interval 秒 (见 RecordWriter)；
+    按天封存的分段在 compress_after 秒后压缩，retention 秒后删除 (None 为永久保留)
+    """
+    pool = SSHPool(hosts)
+    budget = CommandBudget(commands_per_second)
+    save_path = kwargs.get('save_path', './data')
+    writer = RecordWriter(save_path, flush_interval=flush_interval, fsync=fsync).start()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sample') as executor:
+            compactor = asyncio.create_task(compact_all(hosts, executor, save_path, compress_after, retention))
+            try:
+                await asyncio.gather(*[monitor_server(host, pool, executor, budget, writer, **kwargs) for host in hosts])
+            finally:
+                compactor.cancel()
+    finally:
+        writer.close()
 
 
 if __name__ == '__main__':
     set_logger('ServerMonitor', file='./log/monitor.log', basename='my')
     hosts = yaml.load(open('hosts.yml'), Loader=yaml.FullLoader)
-    # monitor_server('spark03', hosts['spark03'])
-    for host, config in hosts.items():
-        threading.Thread(target=monitor_server, args=(host, config,)).start()
+    # asyncio.run(monitor_all({'spark03': hosts['spark03']}))
+    asyncio.run(monitor_all(hosts))
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+from .config import FileConfig
+from .storage import column_store
+
+
+USAGE_FIELDS = ('core_hours', 'gpu_hours', 'gpu_memory_gib_hours')
+
+
+def usage_dir(host, data_dir='./data'):
+    return os.path.join(data_dir, 'usage', host)
+
+
+class UsageAccumulator:
+    """
+    按 (日期, 用户) 累加单台主机的资源用量，每个月一个文件 data/usage/{host}/{YYYY-MM}.json:
+    {"last_timestamp": ..., "days": {"YYYY-MM-DD": {user: {core_hours, gpu_hours, gpu_memory_gib_hours}}}}
+    每个样本代表从上一个样本到当前时刻的时间段 (超过 max_gap 秒的间隔视为采集中断，只计 max_gap)
+    """
+
+    def __init__(self, host, data_dir='./data', max_gap=300):
+        self.path = usage_dir(host, data_dir)
+        self.max_gap = max_gap
+        self._months = {}
+        self._dirty = set()
+        self.last_timestamp = None
+        months = []
+        for filename in sorted(os.listdir(self.path)) if os.path.isdir(self.path) else []:
+            if filename.endswith('.tmp'):
+                os.remove(os.path.join(self.path, filename))  # flush 中断留下的临时文件
+            elif filename.endswith('.json'):
+                months.append(filename)
+        if months:
+            self.last_timestamp = self._load(months[-1].removesuffix('.json')).get('last_timestamp')
+
+    def _load(self, month):
+        if month not in self._months:
+            file_path = os.path.join(self.path, f'{month}.json')
+            if os.path.exists(file_path):
+                with open(file_path) as f:
+                    self._months[month] = json.load(f)
+            else:
+                self._months[month] = {'last_timestamp': None, 'days': {}}
+        return self._months[month]
+
+    def fold(self, record):
+        """ 把一个样本累加到对应日期的用户用量中 """
+        timestamp = record['timestamp']
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return  # 已经统计过
+        hours = (min(timestamp - self.last_timestamp, self.max_gap) if self.last_timestamp is not None else 0) / 3600
+        self.last_timestamp = timestamp
+        day = time.strftime('%Y-%m-%d', time.localtime(timestamp))
+        month = self._load(day[:7])
+        month['last_timestamp'] = timestamp
+        self._dirty.add(day[:7])
+        if hours <= 0:
+            return
+        users = month['days'].setdefault(day, {})
+        usage = lambda user: users.setdefault(user, dict.fromkeys(USAGE_FIELDS, 0.0))
+        for user, cpu in record.get('cpu_per_user') or []:
+            if cpu > 0:
+                usage(user)['core_hours'] += cpu / 100 * hours
+        user2gpus = {}
+        for cuda, user, memory in record.get('cuda_per_user') or []:
+            user2gpus.setdefault(user, set()).add(cuda)
+            usage(user)['gpu_memory_gib_hours'] += memory / 1024 * hours
+        for user, gpus in user2gpus.items():
+            usage(user)['gpu_hours'] += len(gpus) * hours
+
+    def flush(self):
+        """ 写回有变化的月份文件 (先写临时文件再替换，读者不会看到写了一半的文件) """
+        os.makedirs(self.path, exist_ok=True)
+        for month in self._dirty:
+            file_path = os.path.join(self.path, f'{month}.json')
+            with open(file_path + '.tmp', 'w') as f:
+                json.dump(self._months[month], f, separators=(',', ':'))
+            os.replace(file_path + '.tmp', file_path)
+        self._dirty.clear()
+        # 只保留当前月份在内存中
+        for month in sorted(self._months)[:-1]:
+            del self._months[month]
+
+    def backfill(self, store, chunk_rows=4096):
+        """ 从列式存储中补算 last_timestamp 之后的全部样本 (首次运行时即统计全部历史) """
+        data = store.read(start=-float('inf') if self.last_timestamp is None else self.last_timestamp)
+        i0, i1 = data['rows']
+        timestamps = data['timestamp'].tolist()
+        for a in range(i0, i1, chunk_rows):
+            b = min(a + chunk_rows, i1)
+            for timestamp, per_user in zip(timestamps[a - i0:b - i0], store.read_per_user(a, b)):
+                self.fold({'timestamp': timestamp, **per_user})
+            self.flush()
+
+
+_month_files = {}
+
+
+def query_usage(hosts, start_day, end_day, data_dir='./data'):
+    """
+    汇总 [start_day, end_day] (YYYY-MM-DD, 含两端) 内各主机各用户的用量，
+    返回 {host: {user: {core_hours, gpu_hours, gpu_memory_gib_hours}}}
+    """
+    result = {}
+    for host in hosts:
+        path = usage_dir(host, data_dir)
+        if not os.path.isdir(path): continue
+        users = result.setdefault(host, {})
+        for filename in sorted(os.listdir(path)):
+            month = filename.removesuffix('.json')
+            if not filename.endswith('.json') or month < start_day[:7] or month > end_day[:7]: continue
+            file_path = os.path.join(path, filename)
+            days = _month_files.setdefault(file_path, FileConfig(file_path, default={})).get().get('days', {})
+            for day, day_usage in days.items():
+                if not start_day <= day <= end_day: continue
+                for user, usage in day_usage.items():
+                    total = users.setdefault(user, dict.fromkeys(USAGE_FIELDS, 0.0))
+                    for key in USAGE_FIELDS:
+                        total[key] += usage.get(key, 0.0)
+    return result
+
+
+def catch_up_usage(host, data_dir='./data'):
+    usage = UsageAccumulator(host, data_dir)
+    store = column_store(host, data_dir)
+    if store.exists():
+        usage.backfill(store)
+    return usage
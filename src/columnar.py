@@ -0,0 +1,100 @@
+import numpy as np
+from .storage import column_store
+from .rollup import rollup_store
+from .stream import iter_jsonl_rows
+
+
+SERIES = ('cpu', 'memory', 'cpu_free', 'memory_free', 'cuda', 'cuda_free')
+
+
+def read_columns(host, start, end, file_path, data_dir, mapping, resolution=0, per_user=True):
+    """
+    读取 [start, end] 内的历史数据并按列返回：
+    {'timestamp': (n,), 'cpu': (n,), ..., 'cuda': (n, n_gpu), ...}，汇总数据另含 *_min / *_max 列；
+    原始数据另含 'cuda_per_user' (每行一个列表，per_user=False 时不读取)
+    """
+    if resolution > 0:
+        data = rollup_store(host, resolution, data_dir).read(start // resolution * resolution, end)
+        return {name: values for name, values in data.items() if name not in ('rows', 'count')}
+    store = column_store(host, data_dir)
+    if store.exists():
+        data = store.read(start, end)
+        columns = {name: data[name] for name in ('timestamp', *SERIES)}
+        if not per_user:
+            return columns
+        columns['cuda_per_user'] = [
+            [[row[0], mapping.get(row[1], row[1]), row[2]] for row in item['cuda_per_user']]
+            for item in store.read_per_user(*data['rows'])
+        ]
+        return columns
+    # 没有列式存储时，从 JSONL 逐行读取后转置
+    rows = list(iter_jsonl_rows(file_path, host, start, end, mapping))
+    width = max((len(row['cuda'] or []) for row in rows), default=0)
+    columns = {'timestamp': np.array([row['timestamp'] for row in rows], dtype='<f8')}
+    for name in SERIES:
+        if name in ('cuda', 'cuda_free'):
+            array = np.full((len(rows), width), np.nan, dtype='<f4')
+            for i, row in enumerate(rows):
+                values = row[name] or []
+                array[i, :len(values)] = values
+        else:
+            array = np.array([np.nan if row[name] is None else row[name] for row in rows], dtype='<f4')
+        columns[name] = array
+    if per_user:
+        columns['cuda_per_user'] = [row['cuda_per_user'] for row in rows]
+    return columns
+
+
+def _series(columns):
+    """ 展开为 (名称, 一维数组) 列表，按 GPU 的列拆为 'cuda:0'、'cuda:1' ... """
+    series = []
+    for name, values in columns.items():
+        if not isinstance(values, np.ndarray) or name == 'timestamp':
+            continue
+        if values.ndim == 2:
+            # 末尾全为 NaN 的 GPU (补齐产生) 不输出
+            width = int((~np.isnan(values)).any(axis=0).nonzero()[0].max(initial=-1)) + 1
+            series.extend((f'{name}:{i}', values[:, i]) for i in range(width))
+        else:
+            series.append((name, values))
+    return series
+
+
+def _tolist(values, decimals=None):
+    """ 转为 list，NaN 为 None；decimals 不为 None 时先四舍五入 (float32 的值转为 float64 后有多余的尾数) """
+    values = np.asarray(values, dtype=np.float64)
+    if decimals is not None:
+        values = values.round(decimals)
+    result = values.astype(object)
+    result[np.isnan(values)] = None
+    return result.tolist()
+
+
+def to_json(columns, decimals=3):
+    """
+    {timestamp: [...], cpu: [...], cuda: [[gpu0...], [gpu1...]], ...}，缺失值为 null；
+    各序列保留 decimals 位小数 (时间戳不变)
+    """
+    result = {'timestamp': np.asarray(columns['timestamp'], dtype=np.float64).tolist()}
+    for name, values in columns.items():
+        if name == 'timestamp':
+            continue
+        if not isinstance(values, np.ndarray):
+            result[name] = values
+            continue
+        result[name] = [] if values.ndim == 2 else _tolist(values, decimals)
+    for name, values in _series(columns):
+        if ':' in name:
+            result[name.split(':')[0]].append(_tolist(values, decimals))
+    return result
+
+
+def to_binary(columns):
+    """
+    小端二进制：先是 n 个 float64 时间戳，之后每个序列依次为 n 个 float32 (缺失值为 NaN)。
+    返回 (body, names)，names 为时间戳之后各序列的名称，按顺序排列
+    """
+    series = _series(columns)
+    body = [np.ascontiguousarray(columns['timestamp'], dtype='<f8').tobytes()]
+    body.extend(np.ascontiguousarray(values, dtype='<f4').tobytes() for _, values in series)
+    return b''.join(body), [name for name, _ in series]
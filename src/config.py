@@ -0,0 +1,72 @@
+import os
+import json
+import time
+import threading
+
+
+class FileConfig:
+    """
+    按 mtime 缓存的配置文件：只在文件的 mtime 变化时重新加载，
+    且每 check_interval 秒最多 stat 一次，文件不存在时返回 default。
+    binary=True 时以二进制方式打开，loader 读到的是 bytes
+    """
+
+    def __init__(self, path, loader=json.load, default=None, check_interval=1.0, binary=False):
+        self.path = path
+        self.loader = loader
+        self.binary = binary
+        self.default = default
+        self.check_interval = check_interval
+        self._value = default
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        if time.monotonic() - self._checked < self.check_interval:
+            return self._value
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                self._value, self._mtime = self.default, None
+                return self._value
+            if mtime != self._mtime:
+                with open(self.path, 'rb') if self.binary else open(self.path, encoding='utf-8') as f:
+                    self._value = self.loader(f)
+                self._mtime = mtime
+            return self._value
+
+    def version(self):
+        """ 当前内容的版本 (mtime)，可用于生成 ETag """
+        self.get()
+        return self._mtime
+
+
+# 系统用户，不计入按用户汇总的结果
+SYSTEM_USERS = frozenset([
+    'www-data', 'root', 'nobody', 'messagebus', 'syslog',
+    'systemd-timesync', 'earlyoom', 'uuidd', 'colord', 'postfix', '_rpc',
+    'postgres', 'systemd-resolve', 'nvidia-persistenced',
+    'systemd-network', 'whoopsie', 'kernoops', 'systemd-oom',
+    'Debian-snmp', 'daemon', 'mas', 'libvirt-dnsmasq', 'rtkit', 'lp', 'avahi', 'zabbix', 'gdm'
+])
+
+# 用户名 -> 真实姓名 (mapping.json)
+MAPPING = FileConfig('mapping.json', default={})
+# 额外需要忽略的用户 (ignored_users.json, 用户名列表)
+IGNORED_USERS = FileConfig('ignored_users.json', loader=lambda f: SYSTEM_USERS | frozenset(json.load(f)), default=SYSTEM_USERS)
+
+
+def get_mapping():
+    return MAPPING.get()
+
+
+def get_ignored_users():
+    return IGNORED_USERS.get()
+
+
+def get_config_version():
+    """ 影响 API 输出的配置文件的版本，配置变化时缓存的响应随之失效 """
+    return MAPPING.version(), IGNORED_USERS.version()
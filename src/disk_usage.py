@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import shlex
+import asyncio
+import threading
+from logging import getLogger
+from .monitor import exec_batch
+
+logger = getLogger('my.disk')
+
+
+# 远端磁盘用量报告，每月一个 JSONL 文件，每行 {"path": "/data/alice", "size": 字节数, "time": 时间戳}
+REPORT_DIR = '/var/monitor-disk-usage'
+
+
+def _months(timestamp=None):
+    """ 上个月和本月 (YYYYMM)，跨月时上个月报告的末尾仍需同步 """
+    year, month = time.localtime(timestamp)[:2]
+    previous = (year, month - 1) if month > 1 else (year - 1, 12)
+    return [f'{y:04d}{m:02d}' for y, m in (previous, (year, month))]
+
+
+class DiskUsageMirror:
+    """
+    远端磁盘用量报告的本地镜像 data/disk/{host}/{YYYYMM}.jsonl：
+    每次只通过 SFTP 下载本地镜像之后新增的部分 (按字节偏移续传)，
+    内存中维护每个 (磁盘, 用户) 的最新用量，以及一次批量 df 得到的各磁盘容量
+    """
+
+    def __init__(self, pool, data_dir, hosts, interval=600, timeout=60, executor=None):
+        self.pool = pool
+        self.executor = executor
+        self.data_dir = data_dir
+        self.hosts = hosts
+        self.interval = interval
+        self.timeout = timeout
+        self._tables = {}   # host -> {(disk, user): (time, size_gib)}
+        self._disks = {}    # host -> {disk: (total_gib, free_gib)}
+        self._locks = {host: threading.Lock() for host in hosts}
+
+    def _path(self, host, month):
+        return os.path.join(self.data_dir, 'disk', host, f'{month}.jsonl')
+
+    @staticmethod
+    def _ingest(table, data):
+        for line in data.splitlines():
+            try:
+                item = json.loads(line)
+            except Exception:
+                continue
+            disk, user = item['path'].rsplit('/', 1)
+            table[(disk, user)] = (item['time'], item['size'] / 1024 / 1024 / 1024)
+
+    def _load_local(self, host):
+        table = {}
+        for month in _months():
+            if os.path.exists(self._path(host, month)):
+                with open(self._path(host, month), 'rb') as f:
+                    self._ingest(table, f.read())
+        return table
+
+    def _fetch(self, sftp, host, month):
+        """ 下载远端报告中本地镜像之后新增的完整行，返回新增的内容 """
+        remote, local = f'{REPORT_DIR}/{month}.jsonl', self._path(host, month)
+        try:
+            size = sftp.stat(remote).st_size
+        except FileNotFoundError:
+            return b''
+        offset = os.path.getsize(local) if os.path.exists(local) else 0
+        if size < offset:
+            offset = 0  # 远端文件被重写，重新下载
+            os.remove(local)
+        if size == offset:
+            return b''
+        with sftp.file(remote, 'rb') as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        data = data[:data.rfind(b'\n') + 1]  # 最后一行可能还没写完，下次再取
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        with open(local, 'ab') as f:
+            f.write(data)
+        return data
+
+    def _df(self, ssh, disks):
+        """ 一条批量命令获取全部磁盘的容量和剩余空间 (GiB) """
+        commands = {
+            disk: f"df -P -B1 {shlex.quote(disk)} | awk 'NR==2{{print $2/1024/1024/1024, $4/1024/1024/1024}}'"
+            for disk in disks
+        }
+        outputs = exec_batch(ssh, commands, timeout=self.timeout, preamble=None)
+        result = {}
+        for disk, output in outputs.items():
+            if output.strip():
+                total, free = output.split()
+                result[disk] = (float(total), float(free))
+        return result
+
+    def refresh(self, host):
+        """ 同步一台主机的报告并更新 df 结果 (阻塞调用，在线程中执行；同一主机的同步互斥，避免重复追加) """
+        with self._locks[host]:
+            table = dict(self._tables[host]) if host in self._tables else self._load_local(host)
+            try:
+                ssh = self.pool.get(host)
+                with ssh.open_sftp() as sftp:
+                    for month in _months():
+                        self._ingest(table, self._fetch(sftp, host, month))
+                disks = self._df(ssh, sorted({disk for disk, _ in table})) if table else {}
+            except Exception:
+                self.pool.discard(host)
+                raise
+            self._disks[host] = disks
+            self._tables[host] = table
+
+    def get(self, host):
+        """ 返回 [(disk, total, free, {user: size}), ...] 和报告中的最新时间；尚未同步过时返回 None """
+        if host not in self._tables:
+            return None
+        table, disks = self._tables[host], self._disks[host]
+        usage = {}
+        for (disk, user), (_, size) in table.items():
+            usage.setdefault(disk, {})[user] = size
+        latest = max((t for t, _ in table.values()), default=None)
+        return [(disk, *disks[disk], usage[disk]) for disk in sorted(usage) if disk in disks], latest
+
+    async def watch(self):
+        """ 后台任务：每隔 interval 秒逐台同步 (在 executor 中执行，默认为事件循环的线程池) """
+        loop = asyncio.get_running_loop()
+        while True:
+            for host in self.hosts:
+                try:
+                    await loop.run_in_executor(self.executor, self.refresh, host)
+                except Exception as e:
+                    logger.warning(f"Failed to refresh disk usage of {host}: [{type(e)}] {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,77 @@
+import os
+import warnings
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from .rollup import RESOLUTIONS, rollup_store
+from .columnar import SERIES, read_columns, _tolist
+
+
+def host_series(host, metric, start, end, data_dir, step):
+    """
+    读取单台主机某个指标的 (timestamp, values)。按 GPU 的指标合并为一列：
+    cuda_free (MiB) 按 GPU 求和，cuda (%) 按 GPU 取平均。
+    step 不小于某一级汇总的粒度时直接读取汇总数据
+    """
+    tiers = [r for r in RESOLUTIONS if r <= step and rollup_store(host, r, data_dir).exists()]
+    columns = read_columns(host, start, end, os.path.join(data_dir, f'{host}.json'), data_dir, {},
+                           resolution=max(tiers, default=0), per_user=False)
+    timestamp = np.asarray(columns['timestamp'], dtype=np.float64)
+    values = np.asarray(columns[metric], dtype=np.float64)
+    if values.ndim == 2:
+        with np.errstate(invalid='ignore'):
+            if values.shape[1] == 0:
+                values = np.full(len(timestamp), np.nan)
+            elif metric == 'cuda_free':
+                values = np.where(np.isnan(values).all(axis=1), np.nan, np.nansum(values, axis=1))
+            else:
+                values = np.nanmean(values, axis=1)
+    return timestamp, values
+
+
+def align(timestamp, values, start, step, n_bins):
+    """ 把样本对齐到 [start, start + step * n_bins) 的等间隔网格上，每格取均值，无数据为 NaN """
+    bins = np.floor((timestamp - start) / step).astype(np.int64)
+    keep = (bins >= 0) & (bins < n_bins) & ~np.isnan(values)
+    total = np.bincount(bins[keep], weights=values[keep], minlength=n_bins)
+    count = np.bincount(bins[keep], minlength=n_bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def fleet_history(hosts, metric, start, end, step, data_dir='./data', max_workers=8):
+    """
+    并行读取多台主机的同一指标，对齐到公共时间网格后做跨主机聚合。
+    返回 (grid, matrix, aggregates)，matrix 形状为 (主机数, 网格数)
+    """
+    if metric not in SERIES:
+        raise ValueError(f"Unknown metric: {metric}")
+    start = start // step * step  # 网格对齐到 step 的整数倍，与汇总数据的时间桶一致
+    n_bins = max(int(np.ceil((end - start) / step)), 1)
+    grid = start + step * np.arange(n_bins)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        series = list(executor.map(lambda host: host_series(host, metric, start, end, data_dir, step), hosts))
+    matrix = np.vstack([align(t, v, start, step, n_bins) for t, v in series]) if series else np.full((1, n_bins), np.nan)
+    valid = ~np.isnan(matrix)
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # 某一格所有主机都没有数据时 nanmean 等会告警
+        aggregates = {
+            'count': valid.sum(axis=0),
+            'sum': np.where(valid.any(axis=0), np.nansum(matrix, axis=0), np.nan),
+            'mean': np.nanmean(matrix, axis=0),
+            'min': np.nanmin(matrix, axis=0, initial=np.inf, where=valid),
+            'max': np.nanmax(matrix, axis=0, initial=-np.inf, where=valid),
+            'p50': np.nanpercentile(matrix, 50, axis=0),
+            'p95': np.nanpercentile(matrix, 95, axis=0),
+        }
+    aggregates['min'][~valid.any(axis=0)] = np.nan
+    aggregates['max'][~valid.any(axis=0)] = np.nan
+    return grid, matrix, aggregates
+
+
+def to_json(hosts, grid, matrix, aggregates, per_host=False):
+    """ {timestamp: [...], hosts: [...], count/sum/mean/min/max/p50/p95: [...], per_host: {host: [...]}}，缺失值为 null """
+    result = {'timestamp': grid.tolist(), 'hosts': list(hosts)}
+    result.update({name: _tolist(values) for name, values in aggregates.items()})
+    if per_host:
+        result['per_host'] = {host: _tolist(matrix[i]) for i, host in enumerate(hosts)}
+    return result
@@ -0,0 +1,110 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+from starlette.responses import Response
+from .config import FileConfig
+
+
+def make_etag(*parts):
+    """ 由任意可 repr 的 key 生成弱 ETag """
+    return 'W/"' + hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest() + '"'
+
+
+def not_modified(request, etag):
+    """ 请求的 If-None-Match 是否命中 etag """
+    tags = [tag.strip() for tag in request.headers.get('if-none-match', '').split(',')]
+    return '*' in tags or etag in tags or etag.removeprefix('W/') in tags
+
+
+class ResponseCache:
+    """
+    按名称缓存最近一次编码好的 JSON 响应及其 ETag。
+    key 由调用方给出 (如各主机最新样本的时间戳、配置文件版本)，key 不变时直接返回缓存的 bytes，
+    请求带有相同的 If-None-Match 时返回 304
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def respond(self, request, name, key, build):
+        etag = make_etag(name, key)
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
+        cached = self._entries.get(name)
+        if cached is None or cached[0] != etag:
+            cached = self._entries[name] = (etag, build())
+        return Response(content=cached[1], media_type='application/json', headers=headers)
+
+
+class CachedFile:
+    def __init__(self, body, media_type):
+        self.body = body
+        self.media_type = media_type
+        self.hash = hashlib.blake2b(body, digest_size=8).hexdigest()
+        self.etag = f'W/"{self.hash}"'  # gzip 与原文两种表示共用，故为弱 ETag
+        # 文本类文件预先压缩，请求时不再消耗 CPU
+        compressible = media_type.startswith('text/') or media_type in ('application/javascript', 'image/svg+xml')
+        self.gzip = gzip.compress(body) if compressible and len(body) >= 1024 else None
+
+
+class StaticCache:
+    """
+    模板与静态文件的内存缓存：按 mtime 重新加载 (每秒最多 stat 一次)，文本文件预先 gzip。
+    HTML 中引用的 /js/、/css/ 文件会被加上 ?v=<内容哈希>，版本号与当前内容一致的请求可以长期缓存 (immutable)，
+    其他请求用 ETag 协商 (304)
+    """
+    ASSET = re.compile(r'((?:src|href)=")(/?((?:js|css)/[^"?#]+))(")')
+
+    def __init__(self, root='templates'):
+        self.root = root
+        self._files = {}
+        self._rendered = {}
+
+    def _load(self, path):
+        if path not in self._files:
+            if not os.path.isfile(path):
+                return None
+            media_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            self._files[path] = FileConfig(path, loader=lambda f: CachedFile(f.read(), media_type), binary=True)
+        return self._files[path].get()
+
+    def get(self, path):
+        entry = self._load(path)
+        if entry is None or entry.media_type != 'text/html':
+            return entry
+        # 把引用的静态文件替换为带版本号的地址，任何一个文件变化都会重新生成
+        html = entry.body.decode('utf-8')
+        assets = {match[3] for match in self.ASSET.finditer(html)}
+        versions = {asset: self._load(os.path.join(self.root, asset)) for asset in assets}
+        key = (entry.etag, tuple(sorted((asset, v.etag if v else None) for asset, v in versions.items())))
+        cached = self._rendered.get(path)
+        if cached is None or cached[0] != key:
+            def version(match):
+                asset = versions[match[3]]
+                return match[1] + match[2] + (f'?v={asset.hash}' if asset else '') + match[4]
+            cached = self._rendered[path] = (key, CachedFile(self.ASSET.sub(version, html).encode('utf-8'), entry.media_type))
+        return cached[1]
+
+    def respond(self, request, path):
+        if os.path.basename(path).startswith('.'):
+            return Response(status_code=404)
+        entry = self.get(path)
+        if entry is None:
+            return Response(status_code=404)
+        # 只有版本号与当前内容一致时才能长期缓存，旧页面引用的过期版本号仍走 ETag 协商
+        immutable = request.query_params.get('v') == entry.hash
+        headers = {
+            'ETag': entry.etag,
+            'Cache-Control': 'public, max-age=31536000, immutable' if immutable else 'no-cache',
+        }
+        if entry.gzip is not None:
+            headers['Vary'] = 'Accept-Encoding'
+        if not_modified(request, entry.etag):
+            return Response(status_code=304, headers=headers)
+        if entry.gzip is not None and 'gzip' in request.headers.get('accept-encoding', ''):
+            headers['Content-Encoding'] = 'gzip'
+            return Response(content=entry.gzip, media_type=entry.media_type, headers=headers)
+        return Response(content=entry.body, media_type=entry.media_type, headers=headers)
@@ -0,0 +1,116 @@
+import os
+import json
+import asyncio
+from logging import getLogger
+from .users import host_users
+
+logger = getLogger('my.latest')
+
+
+def read_last_line(file_path, block_size=65536):
+    """ 从文件末尾向前读取最后一个完整的行 (不 fork tail 进程) """
+    with open(file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        position, tail = end, b''
+        while position > 0:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+            lines = tail.rstrip(b'\n').rsplit(b'\n', 1)
+            if len(lines) == 2 or position == 0:
+                return lines[-1].decode('utf-8')
+    return None
+
+
+class LatestCache:
+    """
+    每台主机最新一条记录的内存缓存。
+    后台定期 stat 数据文件，只有 mtime/size 变化时才读取最后一行，
+    因此 /api/dashboard、/api/summary 直接从内存返回，不再 fork tail 或读文件。
+    缓存的记录中以 id 存储的用户名已还原。
+    get/items 只读内存，不做文件 I/O；首次读取由使用者在启动时 (在线程中) 调用 refresh 完成。
+    订阅者 (见 subscribe) 在有新记录时收到对应的主机名，供 SSE 推送
+    """
+
+    def __init__(self, data_dir, hosts, poll_interval=1.0):
+        self.data_dir = data_dir
+        self.hosts = hosts
+        self.poll_interval = poll_interval
+        self._records = {}
+        self._stats = {}
+        self._subscribers = set()
+
+    def refresh(self):
+        """ 检查所有主机的数据文件，返回有新记录的主机列表 """
+        updated = []
+        for host in self.hosts:
+            file_path = os.path.join(self.data_dir, f'{host}.json')
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            key = (stat.st_mtime_ns, stat.st_size)
+            if self._stats.get(host) == key:
+                continue
+            try:
+                line = read_last_line(file_path)
+                record = host_users(host, self.data_dir).decode(json.loads(line)) if line else None
+            except Exception as e:
+                # 最后一行可能正在写入，下次再试
+                logger.warning(f"Failed to read latest record of {host}: [{type(e)}] {e}")
+                continue
+            self._stats[host] = key
+            if record is not None and record != self._records.get(host):
+                self._records[host] = record
+                updated.append(host)
+        return updated
+
+    def get(self, host):
+        return self._records.get(host)
+
+    def items(self):
+        return [(host, self._records[host]) for host in self.hosts if host in self._records]
+
+    def subscribe(self):
+        subscriber = Subscriber()
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    async def watch(self):
+        """ 在事件循环中运行的后台任务，文件检查放在线程中执行 """
+        while True:
+            try:
+                updated = await asyncio.to_thread(self.refresh)
+                for subscriber in list(self._subscribers):
+                    subscriber.publish(updated)
+            except Exception as e:
+                logger.error(f"Failed to refresh latest records: [{type(e)}] {e}")
+            await asyncio.sleep(self.poll_interval)
+
+
+class Subscriber:
+    """
+    一个推送连接的待发送主机集合：同一主机的多次更新合并为一次，
+    发送慢的连接占用的内存不超过主机数，也不会阻塞其他连接
+    """
+
+    def __init__(self):
+        self._pending = set()
+        self._event = asyncio.Event()
+
+    def publish(self, hosts):
+        if hosts:
+            self._pending.update(hosts)
+            self._event.set()
+
+    async def wait(self):
+        """ 等待并取出有新记录的主机 """
+        await self._event.wait()
+        self._event.clear()
+        hosts, self._pending = self._pending, set()
+        return hosts
@@ -1,3 +1,5 @@
-from .get_cpu import get_cpu_stats
-from .get_memory import get_memory_stats
-from .get_cuda import get_cuda_stats
\ No newline at end of file
+from .get_cpu import get_cpu_stats, parse_cpu_stats
+from .get_memory import get_memory_stats, parse_memory_stats
+from .get_cuda import get_cuda_stats, parse_cuda_stats
+from .get_batch import BATCH_COMMANDS, exec_batch
+from .get_capability import HostCapability, discover, exec_sample
@@ -0,0 +1,53 @@
+import shlex
+from ..ssh_connect import safe_exec_command
+from .get_cpu import CPU_COMMANDS
+from .get_memory import MEMORY_COMMANDS
+from .get_cuda import CUDA_COMMANDS, CUDA_VALID_SHELL, GPU_PROBE_TIMEOUT
+
+
+BATCH_MARKER = '### ServerMonitor:{} ###'
+BATCH_COMMANDS = {**CPU_COMMANDS, **MEMORY_COMMANDS, **CUDA_COMMANDS}
+
+
+def build_batch_script(commands, preamble=CUDA_VALID_SHELL):
+    """
+    把多条命令拼接成一个 shell 脚本，每条命令的输出前加一行分隔符，
+    这样一次 exec_command (一个 channel, 一次往返) 即可拿到全部结果。
+    分隔符前先输出一个换行，保证上一条命令的输出没有以换行结尾时分隔符仍独占一行；
+    nvidia-smi 命令在远端限时执行，卡住的 GPU 驱动不会拖累整次采样
+    """
+    lines = [preamble] if preamble else []
+    for key, command in commands.items():
+        lines.append(f"printf '\\n%s\\n' '{BATCH_MARKER.format(key)}'")
+        # {valid} 由 preamble 在远端计算
+        command = command.replace('{valid}', '$VALID')
+        if 'nvidia-smi' in command:
+            command = f"timeout {GPU_PROBE_TIMEOUT} sh -c {shlex.quote(command)}"
+        lines.append(f"{{ {command} ; }} 2>/dev/null")
+    return 'sh -c ' + shlex.quote('\n'.join(lines))
+
+
+def parse_batch_output(output):
+    """ 按分隔符把脚本输出切分为 {key: stdout} (去掉分隔符前额外输出的换行) """
+    prefix, suffix = BATCH_MARKER.split('{}')
+    outputs, key, buffer = {}, None, []
+    for line in output.splitlines(keepends=True):
+        stripped = line.rstrip('\n')
+        if stripped.startswith(prefix) and stripped.endswith(suffix):
+            if key is not None:
+                outputs[key] = ''.join(buffer).removesuffix('\n')
+            key, buffer = stripped[len(prefix):-len(suffix)], []
+        elif key is not None:
+            buffer.append(line)
+    if key is not None:
+        outputs[key] = ''.join(buffer)
+    return outputs
+
+
+def exec_batch(client, commands, timeout=60, preamble=CUDA_VALID_SHELL):
+    """
+    执行批量命令，返回收到的各段输出 {key: stdout}。
+    脚本中途退出时缺少的段不在结果中，只有用到这些段的解析会失败
+    """
+    output = safe_exec_command(client, build_batch_script(commands, preamble), timeout=timeout)
+    return parse_batch_output(output)
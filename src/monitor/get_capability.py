@@ -0,0 +1,93 @@
+import time
+from .get_cuda import INVALID_GPU, get_valid_ids
+from .get_batch import BATCH_COMMANDS, exec_batch
+
+
+# 几乎不会变化的探测命令：只在发现主机能力时执行，之后的采样直接复用其输出
+STATIC_COMMANDS = ('cpu_clk_tck', 'cpu_nproc', 'cuda_lspci', 'cuda_list', 'cuda_uuid')
+
+
+def parse_gpu_lines(output):
+    """
+    解析 nvidia-smi 以 "index, ..." 开头的 CSV 行，返回 [(index, [其余字段])]；
+    驱动异常时 nvidia-smi 会输出错误信息 (如 NVIDIA-SMI has failed ...)，这类无法解析的行被跳过
+    """
+    rows = []
+    for line in output.splitlines():
+        fields = [field.strip() for field in line.split(',')]
+        if len(fields) < 2 or not fields[0].isdigit():
+            continue
+        rows.append((int(fields[0]), fields[1:]))
+    return rows
+
+
+class HostCapability:
+    """
+    主机能力档案：CLK_TCK、CPU 核数、是否有 GPU、失效的 GPU、有效 GPU 的 UUID -> 序号。
+    由一次完整的批量采样得到，ttl 秒后过期重新发现；
+    lspci 中有 NVIDIA 设备但 nvidia-smi 没有给出任何 GPU 时 (驱动异常)，或批量输出缺少某些静态命令的段时，
+    按没有 GPU 处理，retry 秒后重新发现
+    """
+
+    def __init__(self, outputs, ttl=3600, retry=300):
+        self.outputs = {key: outputs.get(key, '') for key in STATIC_COMMANDS}
+        self.expires = time.time() + ttl
+        self.nproc = int(self.outputs['cpu_nproc'].strip())
+        self.uuid2index = {fields[0]: index for index, fields in parse_gpu_lines(self.outputs['cuda_uuid'])}
+        self.has_gpu = bool(self.outputs['cuda_lspci']) and bool(self.uuid2index)
+        if (self.outputs['cuda_lspci'] and not self.has_gpu) or any(key not in outputs for key in STATIC_COMMANDS):
+            self.expires = time.time() + min(ttl, retry)
+        self.valid = get_valid_ids(self.outputs['cuda_list']) if self.has_gpu else ''
+        self.broken = [line for line in self.outputs['cuda_list'].splitlines() if INVALID_GPU in line]
+
+    def expired(self):
+        return time.time() >= self.expires
+
+    def commands(self):
+        """ 每次采样需要执行的命令：去掉静态命令，{valid} 在本地替换；没有 GPU 时不执行 CUDA 相关命令 """
+        return {
+            key: command.replace('{valid}', self.valid)
+            for key, command in BATCH_COMMANDS.items()
+            if key not in STATIC_COMMANDS and (self.has_gpu or not key.startswith('cuda'))
+        }
+
+    def matches(self, outputs):
+        """
+        检查本次采样的结果是否与档案一致 (GPU 数量、UUID 未变，没有新的失效 GPU)。
+        nvidia-smi 暂时失败 (没有可解析的行) 不算拓扑变化，由解析 CUDA 数据时报错
+        """
+        if not self.has_gpu:
+            return True
+        if any(INVALID_GPU in line for line in outputs.get('cuda', '').splitlines()):
+            return False
+        gpus = parse_gpu_lines(outputs.get('cuda', ''))
+        if gpus and len(gpus) != len(self.uuid2index):
+            return False
+        for line in outputs.get('cuda_per_user', '').splitlines():
+            fields = [field.strip() for field in line.split(',')]
+            if len(fields) == 3 and fields[0].isdigit() and fields[1] not in self.uuid2index:
+                return False
+        return True
+
+
+def discover(client, timeout=60):
+    """ 执行完整的批量采样 (含静态命令)，返回 (outputs, HostCapability) """
+    outputs = exec_batch(client, BATCH_COMMANDS, timeout=timeout)
+    return outputs, HostCapability(outputs)
+
+
+def exec_sample(client, capability, timeout=60):
+    """
+    按能力档案执行一次采样，返回与完整批量采样相同的 {key: stdout}。
+    相同的命令 (如 cpu_pid2user 与 cuda_pid2user) 只执行一次
+    """
+    commands = capability.commands()
+    unique = {}
+    for key, command in commands.items():
+        unique.setdefault(command, key)
+    outputs = exec_batch(client, {key: command for command, key in unique.items()}, timeout=timeout, preamble=None)
+    for key, command in commands.items():
+        if unique[command] in outputs:
+            outputs[key] = outputs[unique[command]]
+    outputs.update(capability.outputs)
+    return outputs
@@ -1,20 +1,87 @@
 from ..ssh_connect import safe_exec_command
 
 
-def get_cpu_stats(client):
+CPU_COMMANDS = {
+    # 全局 CPU 时间计数器 (jiffies)，以及用于计算间隔的 uptime
+    'cpu_stat': "head -n 1 /proc/stat",
+    'cpu_uptime': "cat /proc/uptime",
+    'cpu_clk_tck': "getconf CLK_TCK",
+    'cpu_nproc': "nproc",
+    # 各个进程的 CPU 时间计数器与所属用户
+    'cpu_proc_stat': "cat /proc/[0-9]*/stat",
+    'cpu_pid2user': "ps -eo user:100,pid",
+}
+
+
+def _parse_proc_stat(output):
+    """ 解析 /proc/[pid]/stat，返回 {pid: (starttime, utime + stime)}，单位 jiffies """
+    procs = {}
+    for line in output.splitlines():
+        # comm 字段可能含有空格和括号，以最后一个 ')' 为界
+        head, _, tail = line.rpartition(')')
+        fields = tail.split()
+        if not head or len(fields) < 20: continue
+        pid = head.split('(', 1)[0].strip()
+        procs[pid] = (int(fields[19]), int(fields[11]) + int(fields[12]))
+    return procs
+
+
+def parse_cpu_stats(outputs, state=None):
+    """
+    根据相邻两次采样之间 /proc/stat 与 /proc/[pid]/stat 计数器的差值计算 CPU 使用率。
+    state 是每台主机各自持有的 dict，用于保存上一次的计数器；首次采样 (或 state=None) 时
+    没有上一次的数据，退化为开机以来 / 进程启动以来的平均值 (与 ps 的 %cpu 含义相同)
+    """
+    state = {} if state is None else state
     record = {}
-    # 获取CPU使用率和总核数
-    result = safe_exec_command(client, "top -b -n 3 -d 1 | grep 'Cpu(s)' | tail -n1")
-    record['cpu'] = float(result.split()[1])
-    result = safe_exec_command(client, "nproc")
-    record['cpu_free'] = int(result.strip()) * (1 - record['cpu'] / 100)
-
-    # 获取系统上各个用户的 CPU 使用情况
-    result = safe_exec_command(client, "ps -eo user:100,%cpu | awk 'NR > 1 {cpu[$1] += $2} END {for (u in cpu) print u, cpu[u]}' | sort -k2 -nr")
-    record['cpu_per_user'] = []
-    for line in result.splitlines(): # Skip the header
-        user, cpu_usage = line.split()
-        record['cpu_per_user'].append((user, float(cpu_usage)))
+    fields = [int(x) for x in outputs['cpu_stat'].split()[1:]]
+    total, idle = sum(fields[:8]), fields[3] + fields[4]  # guest 已计入 user; idle + iowait
+    uptime = float(outputs['cpu_uptime'].split()[0])
+    clk_tck = int(outputs['cpu_clk_tck'].strip())
+    procs = _parse_proc_stat(outputs['cpu_proc_stat'])
+    pid2user = {}
+    for line in outputs['cpu_pid2user'].splitlines()[1:]: # Skip the header
+        user, pid = line.split()
+        pid2user[pid] = user
+
+    prev = state.get('cpu')
+    if prev is not None and prev['uptime'] >= uptime:
+        prev = None  # 主机重启或时钟异常，丢弃旧的计数器
+    if prev is not None and total > prev['total']:
+        record['cpu'] = 100 * (1 - (idle - prev['idle']) / (total - prev['total']))
+    else:
+        record['cpu'] = 100 * (1 - idle / total)
+    record['cpu_free'] = int(outputs['cpu_nproc'].strip()) * (1 - record['cpu'] / 100)
+
+    # 获取系统上各个用户的 CPU 使用情况 (单位: %，100% 即一个核)
+    user2cpu = {}
+    for pid, (starttime, jiffies) in procs.items():
+        if prev is not None:
+            last = prev['procs'].get(pid)
+            if last is not None and last[0] == starttime:
+                seconds = (jiffies - last[1]) / clk_tck
+            elif starttime / clk_tck >= prev['uptime']:
+                seconds = jiffies / clk_tck  # 在两次采样之间启动的进程
+            else:
+                continue  # 上次采样时就已存在却没有记录 (进程在上次读取后才可见)，跳过
+            elapsed = uptime - prev['uptime']
+        else:
+            seconds = jiffies / clk_tck
+            elapsed = uptime - starttime / clk_tck
+        if elapsed <= 0: continue
+        if seconds <= 0 and pid not in pid2user: continue  # 采样过程中产生的短命进程 (如 cat 本身)
+        user = pid2user.get(pid, f'PID{pid}')
+        user2cpu[user] = user2cpu.get(user, 0.0) + 100 * seconds / elapsed
+    record['cpu_per_user'] = sorted(
+        ((user, round(usage, 2)) for user, usage in user2cpu.items()),
+        key=lambda x: x[1], reverse=True
+    )
     # 应当有 sum(usage for user, usage in record['cpu_per_user']) ~ record['cpu'] * record['cpu-free'] / (1 - record['cpu'] / 100)
 
+    state['cpu'] = dict(total=total, idle=idle, uptime=uptime, procs=procs)
     return record
+
+
+def get_cpu_stats(client, state=None):
+    outputs = {key: safe_exec_command(client, command) for key, command in CPU_COMMANDS.items()}
+    return parse_cpu_stats(outputs, state)
@@ -1,28 +1,53 @@
 from ..ssh_connect import safe_exec_command
 
 
-def get_cuda_stats(client):
-    record = {}
-    # 检查是否有GPU
-    result = safe_exec_command(client, "lspci | grep -i nvidia")
-    if not result:
-        return {'cuda': [], 'cuda-free': [], 'cuda_per_user': []}
+INVALID_GPU = 'Unable to determine the device handle for gpu'
 
+CUDA_COMMANDS = {
+    # 检查是否有GPU
+    'cuda_lspci': "lspci | grep -i nvidia",
     # 检查是否有失效的GPU（Unable to determine the device handle for gpu 0000:0A:00.0: Unknown Error）
-    result = safe_exec_command(client, "nvidia-smi -L")
-    if 'Unable to determine the device handle for gpu' in result:
-        valid = []
-        for idx, row in enumerate(result.strip().split('\n')):
-            if 'Unable to determine the device handle for gpu' not in row: 
-                valid.append(row.split(':')[0].split(' ')[1])
-        valid = ' --id=' + ','.join(valid)
-    else:
-        valid = ''
-        
+    'cuda_list': "nvidia-smi -L",
     # 获取每个GPU的显存使用情况和总显存
-    result = safe_exec_command(client, "nvidia-smi --query-gpu=index,memory.used,memory.total --format=csv,noheader,nounits" + valid)
+    'cuda': "nvidia-smi --query-gpu=index,memory.used,memory.total --format=csv,noheader,nounits{valid}",
+    # PID -> User
+    'cuda_pid2user': "ps -eo user:100,pid",
+    # GPU-UUID -> GPU-INDEX
+    'cuda_uuid': "nvidia-smi --query-gpu=index,uuid --format=csv,noheader{valid}",
+    # Memory -> PID & GPU-UUID
+    'cuda_per_user': "nvidia-smi --query-compute-apps=pid,gpu_uuid,used_memory --format=csv,noheader,nounits{valid}",
+}
+
+# 批量采集时每条 nvidia-smi 命令最多执行的秒数 (驱动异常时 nvidia-smi 可能卡住)
+GPU_PROBE_TIMEOUT = 5
+
+# 在远端 shell 中计算 {valid}，供批量采集使用（见 get_batch.py）；导出给带超时的子 shell
+CUDA_VALID_SHELL = (
+    "VALID=''; "
+    f"if timeout {GPU_PROBE_TIMEOUT} nvidia-smi -L 2>&1 | grep -q '{INVALID_GPU}'; then "
+    f"VALID=\" --id=$(timeout {GPU_PROBE_TIMEOUT} nvidia-smi -L 2>&1 | grep -v '{INVALID_GPU}' | awk '{{print $2}}' | tr -d ':' | paste -sd, -)\"; "
+    "fi; export VALID"
+)
+
+
+def get_valid_ids(result):
+    """ 根据 `nvidia-smi -L` 的输出，生成只包含有效 GPU 的 --id 参数 """
+    if INVALID_GPU not in result:
+        return ''
+    valid = []
+    for idx, row in enumerate(result.strip().split('\n')):
+        if INVALID_GPU not in row:
+            valid.append(row.split(':')[0].split(' ')[1])
+    return ' --id=' + ','.join(valid)
+
+
+def parse_cuda_stats(outputs):
+    record = {}
+    if not outputs['cuda_lspci']:
+        return {'cuda': [], 'cuda-free': [], 'cuda_per_user': []}
+
     indexes, memory_useds, memory_totals = [], [], []
-    for gpu in result.strip().split('\n'):
+    for gpu in outputs['cuda'].strip().split('\n'):
         index, memory_used, memory_total = gpu.split(',')
         indexes.append(int(index))
         memory_useds.append(float(memory_used))
@@ -34,22 +59,16 @@ def get_cuda_stats(client):
         record['cuda-free'][index] = memory_total - memory_used
 
     # 获取每个用户在每个显卡上的显存使用情况
-    # PID -> User
-    result = safe_exec_command(client, "ps -eo user:100,pid")
     pid2user = {}
-    for line in result.splitlines()[1:]: # Skip the header
+    for line in outputs['cuda_pid2user'].splitlines()[1:]: # Skip the header
         user, pid = line.split()
         pid2user[pid] = user
-    # GPU-UUID -> GPU-INDEX
-    result = safe_exec_command(client, "nvidia-smi --query-gpu=index,uuid --format=csv,noheader" + valid)
     uuid2cuda = {}
-    for line in result.splitlines():
+    for line in outputs['cuda_uuid'].splitlines():
         index, uuid = line.split(',')
         uuid2cuda[uuid] = f'cuda:{index}'
-    # Memory -> PID & GPU-UUID
-    result = safe_exec_command(client, "nvidia-smi --query-compute-apps=pid,gpu_uuid,used_memory --format=csv,noheader,nounits" + valid)
     record['cuda_per_user'] = []
-    for line in result.splitlines():
+    for line in outputs['cuda_per_user'].splitlines():
         pid, uuid, memory = line.split(',')
         cuda = uuid2cuda.get(uuid, 'UNKNOWN')
         user = pid2user.get(pid, f'PID{pid}')
@@ -61,3 +80,15 @@ def get_cuda_stats(client):
     #     cuda_usage[int(device.split(':')[1])] += usage
     # (100 * cuda_usage / np.array(record['cuda-free']) * (1 - np.array(record['cuda']) / 100)).tolist() ~ record['cuda']
     return record
+
+
+def get_cuda_stats(client):
+    outputs = {'cuda_lspci': safe_exec_command(client, CUDA_COMMANDS['cuda_lspci'])}
+    if not outputs['cuda_lspci']:
+        return parse_cuda_stats(outputs)
+    outputs['cuda_list'] = safe_exec_command(client, CUDA_COMMANDS['cuda_list'])
+    valid = get_valid_ids(outputs['cuda_list'])
+    for key, command in CUDA_COMMANDS.items():
+        if key not in outputs:
+            outputs[key] = safe_exec_command(client, command.format(valid=valid))
+    return parse_cuda_stats(outputs)
@@ -0,0 +1,58 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Offloader:
+    """
+    把 API 中的阻塞调用 (SSH、文件读取与解析) 放到有界线程池中执行，事件循环只负责调度：
+    SSH 与本地 I/O 各用一个线程池，慢的主机不会占满读取历史数据的线程；
+    每个端点另有并发上限 (超出的请求排队等待) 和超时 (抛出 TimeoutError)。
+    超时只是不再等待结果，线程中的调用仍会执行完 (SSH 命令本身也有超时)
+    """
+
+    def __init__(self, io_workers=16, ssh_workers=8):
+        self.executors = {
+            'io': ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='api-io'),
+            'ssh': ThreadPoolExecutor(max_workers=ssh_workers, thread_name_prefix='api-ssh'),
+        }
+        self.endpoints = {}
+
+    def endpoint(self, name, concurrency, timeout, executor='io'):
+        """ 登记一个端点：最多 concurrency 个调用同时执行，每个调用最多等待 timeout 秒 """
+        self.endpoints[name] = (asyncio.Semaphore(concurrency), timeout, self.executors[executor])
+
+    async def wait(self, name, awaitable):
+        """ 在端点的并发上限和超时下等待 awaitable (用于自行调度线程的缓存类，传入未开始的协程) """
+        semaphore, timeout, _ = self.endpoints[name]
+        async with semaphore:
+            return await asyncio.wait_for(awaitable, timeout)
+
+    async def run(self, name, func, *args):
+        """ 在端点对应的线程池中执行 func(*args)，排队结束后才提交到线程池 """
+        semaphore, timeout, executor = self.endpoints[name]
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            return await asyncio.wait_for(loop.run_in_executor(executor, func, *args), timeout)
+
+    async def stream(self, name, chunks):
+        """
+        在端点的并发上限和超时下迭代同步生成器 chunks (用作 StreamingResponse 的内容)：
+        整个迭代占用一个并发名额，每块在线程池中生成，总耗时超过 timeout 时抛出 TimeoutError 中止响应
+        """
+        semaphore, timeout, executor = self.endpoints[name]
+        loop = asyncio.get_running_loop()
+        done = object()
+        async with semaphore:
+            deadline = loop.time() + timeout
+            try:
+                while True:
+                    chunk = await asyncio.wait_for(loop.run_in_executor(executor, next, chunks, done),
+                                                   max(deadline - loop.time(), 0))
+                    if chunk is done:
+                        return
+                    yield chunk
+            finally:
+                try:
+                    chunks.close()
+                except ValueError:
+                    pass  # 超时后线程中的 next 仍在执行，生成器随之结束
@@ -0,0 +1,94 @@
+import os
+import numpy as np
+from .storage import ColumnStore, RECORD_COLUMNS, column_store
+
+
+RESOLUTIONS = (60, 600, 3600)  # 1 min / 10 min / 1 h
+ROLLUP_METRICS = ('cpu', 'cpu_free', 'memory', 'memory_free', 'cuda', 'cuda_free')
+
+# 每个指标保存 mean / min / max 三列，timestamp 为时间桶的起点，count 为桶内原始样本数
+ROLLUP_COLUMNS = {
+    'timestamp': ('<f8', False),
+    'count': ('<u4', False),
+    **{metric + suffix: ('<f4', RECORD_COLUMNS[metric][1]) for metric in ROLLUP_METRICS for suffix in ('', '_min', '_max')},
+}
+
+
+def rollup_store(host, resolution, data_dir='./data'):
+    return ColumnStore(os.path.join(data_dir, 'columns', host, f'{resolution}s'), columns=ROLLUP_COLUMNS, per_user=False)
+
+
+def aggregate(data, resolution):
+    """
+    把原始数据按 resolution 秒分桶，返回每个桶的 mean/min/max (忽略 NaN)。
+    data 为 ColumnStore.read 的结果，需按时间戳递增
+    """
+    timestamp = np.asarray(data['timestamp'])
+    if len(timestamp) == 0:
+        return {'timestamp': np.empty(0), 'count': np.empty(0, dtype='<u4')}
+    buckets = np.floor(timestamp / resolution) * resolution
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    result = {'timestamp': buckets[starts], 'count': np.diff(np.r_[starts, len(buckets)]).astype('<u4')}
+    for metric in ROLLUP_METRICS:
+        values = np.asarray(data[metric], dtype=np.float64)
+        if values.ndim == 2 and values.shape[1] == 0:
+            continue
+        valid = ~np.isnan(values)
+        count = np.add.reduceat(valid, starts, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[metric] = np.add.reduceat(np.where(valid, values, 0), starts, axis=0) / count
+        result[metric + '_min'] = np.fmin.reduceat(values, starts, axis=0)
+        result[metric + '_max'] = np.fmax.reduceat(values, starts, axis=0)
+    return result
+
+
+def _to_records(result):
+    """ 把按列的聚合结果转换成 ColumnStore.extend 需要的逐行字典 """
+    records = []
+    for i in range(len(result['timestamp'])):
+        record = {}
+        for name, values in result.items():
+            value = values[i]
+            record[name] = value.tolist() if isinstance(value, np.ndarray) else value.item()
+        records.append(record)
+    return records
+
+
+def update_rollups(store, host, data_dir='./data', resolutions=RESOLUTIONS):
+    """
+    增量维护各级汇总：对每一级，从已汇总的最后一个桶之后开始读取原始数据，
+    把已经结束的桶 (之后已有更新的样本) 追加到汇总中；尚未结束的桶留待下次处理。
+    首次调用时会回填全部历史
+    """
+    for resolution in resolutions:
+        tier = rollup_store(host, resolution, data_dir)
+        last = tier.last_timestamp()
+        start = -np.inf if last is None else last + resolution
+        data = store.read(start=start)
+        if len(data['timestamp']) == 0:
+            continue
+        # 最后一个桶可能尚未结束，不写入
+        current = np.floor(data['timestamp'][-1] / resolution) * resolution
+        end = int(np.searchsorted(data['timestamp'], current, side='left'))
+        if end == 0:
+            continue
+        result = aggregate({name: values[:end] for name, values in data.items() if name != 'rows'}, resolution)
+        tier.extend(_to_records(result))
+
+
+def choose_resolution(host, start, end, data_dir='./data', resolution=None, max_points=None):
+    """
+    选择查询使用的分辨率 (0 表示原始数据)：
+    指定 resolution 时使用不超过它的最粗一级；指定 max_points 时使用点数不超过它的最细一级
+    """
+    tiers = [0] + [r for r in RESOLUTIONS if rollup_store(host, r, data_dir).exists()]
+    if resolution is not None:
+        return max(r for r in tiers if r <= max(resolution, 0))
+    if max_points is not None:
+        for r in tiers:
+            store = column_store(host, data_dir) if r == 0 else rollup_store(host, r, data_dir)
+            i0, i1 = store.read(start, end, columns=['timestamp'])['rows']
+            if i1 - i0 <= max_points:
+                return r
+        return tiers[-1]
+    return 0
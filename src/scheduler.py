@@ -0,0 +1,74 @@
+import time
+import asyncio
+
+
+# 可选的采样间隔 (秒)，均为最小值的整数倍，同一档位的主机仍在相同时刻采样
+INTERVALS = (10, 30, 60, 120)
+
+
+class CommandBudget:
+    """
+    全部主机共享的 SSH 命令预算 (令牌桶)：平均每秒最多 rate 条命令，允许 burst 条的突发。
+    acquire 按请求顺序排队，预算不足时等待而不是丢弃采样
+    """
+
+    def __init__(self, rate=10.0, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, n=1):
+        n = min(n, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                await asyncio.sleep((n - self.tokens) / self.rate)
+
+
+class AdaptiveInterval:
+    """
+    单台主机的自适应采样间隔：
+    CPU / 内存 / 显存使用率变化超过 threshold (%)，或 GPU 上的 (GPU, 用户) 集合变化时，立即回到最短间隔；
+    连续 stable_samples 次没有变化后放宽一档，直到 intervals[-1]
+    """
+
+    def __init__(self, intervals=INTERVALS, threshold=5.0, stable_samples=3):
+        self.intervals = intervals
+        self.threshold = threshold
+        self.stable_samples = stable_samples
+        self.level = 0
+        self.stable = 0
+        self._last = None
+
+    @property
+    def interval(self):
+        return self.intervals[self.level]
+
+    def _changed(self, record):
+        last, self._last = self._last, record
+        if last is None:
+            return True
+        if abs(record['cpu'] - last['cpu']) > self.threshold or abs(record['memory'] - last['memory']) > self.threshold:
+            return True
+        cuda, last_cuda = record.get('cuda') or [], last.get('cuda') or []
+        if len(cuda) != len(last_cuda) or any(abs(a - b) > self.threshold for a, b in zip(cuda, last_cuda)):
+            return True
+        processes = lambda r: {(row[0], row[1]) for row in r.get('cuda_per_user') or []}
+        return processes(record) != processes(last)
+
+    def update(self, record):
+        """ 根据新的样本调整档位，返回下一次采样的间隔 """
+        if self._changed(record):
+            self.level, self.stable = 0, 0
+        else:
+            self.stable += 1
+            if self.stable >= self.stable_samples and self.level < len(self.intervals) - 1:
+                self.level, self.stable = self.level + 1, 0
+        return self.interval
@@ -0,0 +1,252 @@
+import os
+import json
+import gzip
+import time
+import shutil
+import threading
+import numpy as np
+from logging import getLogger
+from .config import FileConfig
+from .latest import read_last_line
+from .time_index import TimeIndex, get_timestamp
+
+logger = getLogger('my.segments')
+
+
+def segment_day(timestamp):
+    """ 样本所属分段的日期 (本地时间，与用量统计一致) """
+    return time.strftime('%Y-%m-%d', time.localtime(timestamp))
+
+
+def open_segment(path):
+    """ 以二进制方式打开分段，.gz 自动解压 """
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def read_first_line(file_path):
+    with open(file_path, 'rb') as f:
+        line = f.readline()
+    return line if line.endswith(b'\n') else None
+
+
+def parse_timestamp(line):
+    """ get_timestamp 的容错版本：空行、写了一半或损坏的行返回 None """
+    if not line:
+        return None
+    try:
+        return get_timestamp(line)
+    except Exception:
+        return None
+
+
+class Segments:
+    """
+    单台主机按天划分的 JSONL 分段 data/segments/{host}/{YYYY-MM-DD}.jsonl[.gz]，
+    及记录各分段时间范围的清单 manifest.json ([{"name": ..., "start": ..., "end": ...}]，按时间排序)。
+    data/{host}.json 始终是正在写入的分段，日期变化时由写入线程封存 (seal) 到 segments 目录；
+    封存较久的分段压缩为 gzip，超过保留期限的分段删除 (见 compact)。
+    修改清单的操作 (封存、压缩、删除) 在进程内互斥，读取方只读清单
+    """
+
+    def __init__(self, host, data_dir='./data'):
+        self.host = host
+        self.active = os.path.join(data_dir, f'{host}.json')
+        self.path = os.path.join(data_dir, 'segments', host)
+        self.manifest_path = os.path.join(self.path, 'manifest.json')
+        self._manifest = FileConfig(self.manifest_path, default=[])
+        self._lock = threading.Lock()
+
+    def entries(self):
+        """ 清单 (按 mtime 缓存，供读取方使用) """
+        return self._manifest.get()
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return []
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _save(self, entries):
+        os.makedirs(self.path, exist_ok=True)
+        entries.sort(key=lambda entry: entry['start'])
+        with open(self.manifest_path + '.tmp', 'w') as f:
+            json.dump(entries, f, indent=1)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _unique_name(self, day):
+        """ 同一天已有分段时 (如时钟回拨) 加上序号 """
+        name, i = f'{day}.jsonl', 0
+        while os.path.exists(self._file(name)) or os.path.exists(self._file(name + '.gz')):
+            i += 1
+            name = f'{day}.{i}.jsonl'
+        return name
+
+    @staticmethod
+    def _time_range(path):
+        """ 第一条和最后一条可解析记录的时间戳 (跳过损坏的行)，没有可解析的记录时抛出 ValueError """
+        first = last = None
+        if not path.endswith('.gz'):
+            # 通常首尾两行即可确定，不必读取整个文件
+            first, last = parse_timestamp(read_first_line(path)), parse_timestamp(read_last_line(path))
+        if first is None or last is None:
+            with open_segment(path) as f:
+                for line in f:
+                    timestamp = parse_timestamp(line)
+                    if timestamp is not None:
+                        first = timestamp if first is None else first
+                        last = timestamp
+        if first is None:
+            raise ValueError(f"No valid record in {path}")
+        return first, last
+
+    def files(self, start=-np.inf, end=np.inf):
+        """ 与 [start, end] 有重叠的分段文件 (按时间排序)，当前分段在最后 """
+        entries = self.entries()
+        paths = [self._file(entry['name']) for entry in entries if entry['end'] >= start and entry['start'] <= end]
+        # 当前分段的记录都晚于已封存的分段
+        if os.path.exists(self.active) and max((entry['end'] for entry in entries), default=-np.inf) < end:
+            paths.append(self.active)
+        return paths
+
+    def seal(self):
+        """ 把当前分段移入 segments 目录并登记到清单 (由写入线程在关闭文件后调用) """
+        with self._lock:
+            try:
+                start, end = self._time_range(self.active)
+            except ValueError:
+                start = end = os.path.getmtime(self.active)  # 只有损坏的行，按修改时间登记
+            name = self._unique_name(segment_day(start))
+            os.makedirs(self.path, exist_ok=True)
+            os.replace(self.active, self._file(name))
+            if os.path.exists(self.active + '.idx'):
+                os.replace(self.active + '.idx', self._file(name) + '.idx')
+            entries = self._load()
+            entries.append(dict(name=name, start=start, end=end))
+            self._save(entries)
+        logger.info(f"Sealed segment {name} of {self.host}")
+
+    def recover(self):
+        """ 让清单与目录一致：补登记封存后未写入清单的分段，处理压缩中断留下的文件 """
+        if not os.path.isdir(self.path):
+            return
+        with self._lock:
+            entries = {entry['name']: entry for entry in self._load()}
+            names = set(os.listdir(self.path))
+            for name in sorted(names):
+                if name.endswith('.jsonl.gz') and name.removesuffix('.gz') in names:
+                    # gzip 文件是原子写入的，原始文件已可删除
+                    self._remove(name.removesuffix('.gz'))
+                    entries.pop(name.removesuffix('.gz'), None)
+            names = set(os.listdir(self.path))
+            for name in sorted(names):
+                if name.endswith('.tmp'):
+                    os.remove(self._file(name))
+                elif (name.endswith('.jsonl') or name.endswith('.jsonl.gz')) and name not in entries:
+                    try:
+                        start, end = self._time_range(self._file(name))
+                    except Exception as e:
+                        logger.error(f"Failed to read segment {name} of {self.host}: [{type(e)}] {e}")
+                        continue
+                    entries[name] = dict(name=name, start=start, end=end)
+            self._save([entry for name, entry in entries.items() if name in names])
+
+    def split(self):
+        """
+        把跨越多天的当前分段 (如旧版本一直追加的 data/{host}.json) 拆分为按天的分段，只留下最后一天；
+        早于已封存分段的记录视为已封存 (上次拆分中断)，直接丢弃
+        """
+        if read_first_line(self.active) is None:
+            return
+        try:
+            first, last = self._time_range(self.active)
+        except ValueError:
+            return
+        last_day = segment_day(last)
+        if segment_day(first) == last_day:
+            return
+        entries = self._load()
+        sealed = max((entry['end'] for entry in entries), default=-np.inf)
+        day, out, current = None, None, None
+        with open(self.active, 'rb') as f, open(self.active + '.tmp', 'wb') as rest:
+            for line in f:
+                timestamp = parse_timestamp(line)  # 无法解析的行跟随前一行
+                if timestamp is not None and timestamp <= sealed:
+                    continue
+                if day != last_day and timestamp is not None and segment_day(timestamp) != day:
+                    if out is not None:
+                        out.close()
+                    day = segment_day(timestamp)
+                    if day == last_day:
+                        out = None
+                    else:
+                        os.makedirs(self.path, exist_ok=True)
+                        current = dict(name=self._unique_name(day), start=timestamp, end=timestamp)
+                        entries.append(current)
+                        out = open(self._file(current['name']), 'wb')
+                if out is None:
+                    rest.write(line)
+                else:
+                    out.write(line)
+                    if timestamp is not None:
+                        current['end'] = timestamp
+            if out is not None:
+                out.close()
+        for entry in entries:
+            if not entry['name'].endswith('.gz'):
+                TimeIndex(self._file(entry['name'])).build()
+        with self._lock:
+            self._save(entries)
+            os.replace(self.active + '.tmp', self.active)
+            if os.path.exists(self.active + '.idx'):
+                os.remove(self.active + '.idx')
+        logger.info(f"Split {self.active} into {len(entries)} daily segments")
+
+    def _remove(self, name):
+        for path in (self._file(name), self._file(name) + '.idx'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def compact(self, covered, compress_after=86400, retention=None):
+        """
+        压缩结束时间早于 compress_after 秒前的分段，删除结束时间早于 retention 秒前的分段 (None 为永久保留)；
+        只处理已经导入列式存储 (各级汇总由其生成) 的分段，即 end <= covered
+        """
+        now = time.time()
+        for entry in self._load():
+            if entry['end'] > covered:
+                continue
+            if retention is not None and entry['end'] < now - retention:
+                with self._lock:
+                    self._save([e for e in self._load() if e['name'] != entry['name']])
+                self._remove(entry['name'])
+                logger.info(f"Removed segment {entry['name']} of {self.host} (retention)")
+            elif not entry['name'].endswith('.gz') and entry['end'] < now - compress_after:
+                # 压缩耗时较长，在锁外进行；写入临时文件后原子替换
+                name = entry['name'] + '.gz'
+                with open(self._file(entry['name']), 'rb') as src, gzip.open(self._file(name) + '.tmp', 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+                os.replace(self._file(name) + '.tmp', self._file(name))
+                with self._lock:
+                    entries = self._load()
+                    for e in entries:
+                        if e['name'] == entry['name']:
+                            e['name'] = name
+                    self._save(entries)
+                self._remove(entry['name'])
+
+
+_lock = threading.Lock()
+_segments = {}
+
+
+def host_segments(host, data_dir='./data'):
+    """ 每台主机共享一个 Segments 实例 (进程内缓存) """
+    key = os.path.join(data_dir, host)
+    with _lock:
+        if key not in _segments:
+            _segments[key] = Segments(host, data_dir)
+        return _segments[key]
+
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import asyncio
+from logging import getLogger
+from .monitor import exec_batch
+
+logger = getLogger('my.server_info')
+
+
+# 硬件/系统信息的探测命令，合并为一条批量命令执行 (见 src/monitor/get_batch.py)
+INFO_COMMANDS = {
+    'hostname': "hostname -f 2>/dev/null || hostname",
+    'lscpu': "lscpu",
+    'cores': "grep 'core id' /proc/cpuinfo | sort -u | wc -l",
+    'nproc': "nproc",
+    'scaling_cur_freq': "cat /sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq",
+    'flags': "grep '^flags' /proc/cpuinfo | head -n 1",
+    'meminfo': "grep MemTotal /proc/meminfo",
+    'gpu': "nvidia-smi --query-gpu=name,memory.total --format=csv,noheader",
+    'cuda_version': "nvidia-smi | grep -i 'CUDA Version' | head -n1 | awk -F 'CUDA Version: ' '{print $2}' | awk '{print $1}'",
+    'os_release': "grep PRETTY_NAME /etc/os-release",
+    'uname': "uname -a",
+}
+
+
+def _mhz(value):
+    try:
+        return f"{float(value):.0f} MHz"
+    except (TypeError, ValueError):
+        return 'N/A'
+
+
+def parse_server_info(outputs):
+    """ 把批量命令的输出整理为 {项目: 描述}，顺序即展示顺序 """
+    lscpu = {}
+    for line in outputs['lscpu'].splitlines():
+        if ':' in line:
+            key, value = line.split(':', 1)
+            lscpu[key.strip()] = value.strip()
+    info = {}
+    info["💻 Hostname"] = outputs['hostname'].strip()
+    info["🧠 CPU Model"] = lscpu.get('Model name', 'N/A')
+    info["⚙️ Cores / Threads"] = f"{outputs['cores'].strip()} C / {outputs['nproc'].strip()} T"
+    freq = lscpu.get('CPU MHz')
+    if freq is None and outputs['scaling_cur_freq'].strip():
+        freq = int(outputs['scaling_cur_freq']) / 1000  # kHz -> MHz
+    freq = f"{float(freq):.2f} MHz" if freq is not None else 'N/A'
+    info["⏱️ CPU Frequency"] = f"{freq} (min={_mhz(lscpu.get('CPU min MHz'))}, max={_mhz(lscpu.get('CPU max MHz'))})"
+    flags = set(outputs['flags'].split(':', 1)[-1].split())
+    info["🧩 SIMD Support"] = f"AVX={'avx' in flags}, AVX2={'avx2' in flags}, AVX512={any('avx512f' in f for f in flags)}"
+    info["🗃️ L3 Cache"] = lscpu.get('L3 cache', 'N/A')
+    info["🔀 NUMA Nodes"] = lscpu.get('NUMA node(s)', 'N/A')
+    try:
+        mem_kB = int(outputs['meminfo'].removeprefix('MemTotal:').strip().removesuffix('kB').strip())
+        info["💾 Memory Total"] = f"{mem_kB / 1024 / 1024:.0f} GB"
+    except ValueError:
+        info["💾 Memory Total"] = 'N/A'
+    try:
+        gpus = {}  # name -> [count, memory]
+        for line in outputs['gpu'].strip().splitlines():
+            name, memory = (item.strip() for item in line.split(','))
+            gpus.setdefault(name, [0, int(memory.removesuffix('MiB').strip()) / 1024])[0] += 1
+        gpu_model = ", ".join(f"{count}*{name} ({mem_GB:.0f} GiB) " for name, (count, mem_GB) in gpus.items()) or "N/A"
+    except Exception:
+        gpu_model = f"N/A ({outputs['gpu'].strip()})"
+    info["🎮 GPU Model"] = gpu_model
+    info["🚀 CUDA Version"] = outputs['cuda_version'].strip() or "N/A"
+    info["🐧 OS Version"] = outputs['os_release'].strip().removeprefix('PRETTY_NAME=').strip('"')
+    info["🧱 Kernel Version"] = outputs['uname'].strip()
+    return info
+
+
+def format_server_info(info, timestamp):
+    max_len = max(len(k) for k in info)
+    content = '\n'.join([f"{k:{max_len}} : {v}" for k, v in info.items()])
+    max_len = max(map(len, content.splitlines()))
+    updated = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+    return (
+        '=' * max_len + '\n' +
+        f'🔍 Server Hardware Info Summary (updated {updated})\n' +
+        '=' * max_len + '\n' +
+        content + '\n' +
+        '=' * max_len
+    )
+
+
+class ServerInfoCache:
+    """
+    各主机硬件/系统信息的缓存，持久化为 data/info/{host}.json ({"timestamp": ..., "info": {...}})。
+    超过 ttl 秒的信息仍先返回旧值，同时在后台重新探测；探测在 executor (默认线程池) 中执行，不阻塞事件循环
+    """
+
+    def __init__(self, pool, data_dir, hosts, ttl=86400, timeout=60, executor=None):
+        self.pool = pool
+        self.executor = executor
+        self.data_dir = data_dir
+        self.hosts = hosts
+        self.ttl = ttl
+        self.timeout = timeout
+        self._cache = {}
+        self._tasks = {}
+
+    def _path(self, host):
+        return os.path.join(self.data_dir, 'info', f'{host}.json')
+
+    def load(self, host):
+        if host not in self._cache and os.path.exists(self._path(host)):
+            with open(self._path(host)) as f:
+                self._cache[host] = json.load(f)
+        return self._cache.get(host)
+
+    def probe(self, host):
+        """ 通过 SSH 执行一次批量命令并写入缓存文件 (阻塞调用) """
+        try:
+            outputs = exec_batch(self.pool.get(host), INFO_COMMANDS, timeout=self.timeout, preamble=None)
+        except Exception:
+            self.pool.discard(host)
+            raise
+        # 批量输出中缺少的段 (脚本中途退出) 按空输出展示为 N/A
+        outputs = {key: outputs.get(key, '') for key in INFO_COMMANDS}
+        entry = {'timestamp': time.time(), 'info': parse_server_info(outputs)}
+        path = self._path(host)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+        self._cache[host] = entry
+        return entry
+
+    def refresh(self, host):
+        """ 在线程中重新探测；同一主机同时只有一次探测，并发的请求共享其结果 """
+        task = self._tasks.get(host)
+        if task is None or task.done():
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self.probe, host)
+            task = self._tasks[host] = asyncio.ensure_future(future)
+            task.add_done_callback(lambda t: t.cancelled() or t.exception() is None or logger.warning(
+                f"Failed to probe server info of {host}: [{type(t.exception())}] {t.exception()}"
+            ))
+        return task
+
+    async def get(self, host, refresh=False):
+        entry = self.load(host)
+        if entry is None or refresh:
+            # 调用方超时取消时不影响共享的探测
+            return await asyncio.shield(self.refresh(host))
+        if time.time() - entry['timestamp'] > self.ttl:
+            self.refresh(host)
+        return entry
+
+    async def watch(self, check_interval=3600):
+        """ 后台任务：逐台刷新没有缓存或已过期的主机 """
+        while True:
+            for host in self.hosts:
+                entry = self.load(host)
+                if entry is not None and time.time() - entry['timestamp'] <= self.ttl:
+                    continue
+                try:
+                    await self.refresh(host)
+                except Exception:
+                    pass  # 已由 refresh 记录日志
+            await asyncio.sleep(check_interval)
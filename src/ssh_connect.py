@@ -1,42 +1,77 @@
+import time
+import socket
 import paramiko
 import threading
 
 
+# 跳板机连接按 (hostname, port, username) 共享：每个跳板只认证一次，
+# 目标主机的 direct-tcpip channel 都复用同一条 transport
+_jumpers = {}
+_jumper_locks = {}
+_lock = threading.Lock()
+
+
+def get_jumper_transport(jumper_config, stale=None):
+    """ 返回跳板机的 transport；stale 为调用方发现已失效的 transport，仅当它仍是当前连接时才重连 """
+    key = (jumper_config['hostname'], jumper_config.get('port', 22), jumper_config.get('username'))
+    with _lock:
+        lock = _jumper_locks.setdefault(key, threading.Lock())
+    with lock:
+        jumper = _jumpers.get(key)
+        transport = jumper.get_transport() if jumper is not None else None
+        if transport is None or transport is stale or not transport.is_active():
+            if jumper is not None:
+                jumper.close()
+            jumper = paramiko.SSHClient()
+            jumper.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            jumper.connect(**jumper_config, timeout=30)
+            transport = jumper.get_transport()
+            if transport is None or not transport.is_active():
+                raise RuntimeError("跳板 transport 不可用")
+            transport.set_keepalive(30)
+            _jumpers[key] = jumper
+        return transport
+
+
 def ssh_connect(server_config):
+    config = dict(server_config)  # 不修改调用方的配置，重连时仍然经过跳板
+    jumper_config = config.pop('jumper', None)
     ssh = paramiko.SSHClient()
     ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    if 'jumper' in server_config:
-        jumper_config = server_config.pop('jumper')
-        jumper = paramiko.SSHClient()
-        jumper.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        jumper.connect(**jumper_config, timeout=30)
-        transport = jumper.get_transport()
-        if transport is None or not transport.is_active():
-            raise RuntimeError("跳板 transport 不可用")
-        # open_channel 建立 direct-tcpip 到目标主机
-        sock = transport.open_channel(
-            "direct-tcpip",
-            dest_addr=(server_config['hostname'], server_config['port']), 
-            src_addr=("127.0.0.1", 0)
-        )
-        server_config['sock'] = sock
-    ssh.connect(**server_config, timeout=30)
+    if jumper_config is not None:
+        dest_addr = (config['hostname'], config.get('port', 22))
+        transport = get_jumper_transport(jumper_config)
+        try:
+            # open_channel 建立 direct-tcpip 到目标主机
+            sock = transport.open_channel("direct-tcpip", dest_addr=dest_addr, src_addr=("127.0.0.1", 0))
+        except (paramiko.SSHException, socket.error, EOFError):
+            # 跳板连接已断开但尚未被发现，重新登录跳板后再试一次 (并发的重连只会登录一次)
+            transport = get_jumper_transport(jumper_config, stale=transport)
+            sock = transport.open_channel("direct-tcpip", dest_addr=dest_addr, src_addr=("127.0.0.1", 0))
+        config['sock'] = sock
+    ssh.connect(**config, timeout=30)
     return ssh
 
 
 def safe_exec_command(client, command, timeout=60):
-    stdin, stdout, stderr = client.exec_command(command)
-    
-    def read_output(out, result_holder):
-        result_holder.append(out.read().decode())
-
-    result = []
-    thread = threading.Thread(target=read_output, args=(stdout, result))
-    thread.start()
-    thread.join(timeout=timeout)
-
-    if thread.is_alive():
-        stdout.channel.close()  # 强制关闭channel
-        thread.join()
-        raise TimeoutError(f"Command timed out: {command}")
-    return result[0]
+    """ 执行命令并读取 stdout；通过 channel 的超时而不是额外线程来保证总耗时不超过 timeout """
+    deadline = time.monotonic() + timeout
+    stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+    channel = stdout.channel
+    chunks = []
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Command timed out: {command}")
+            channel.settimeout(remaining)
+            try:
+                data = channel.recv(32768)
+            except socket.timeout:
+                raise TimeoutError(f"Command timed out: {command}")
+            if not data:
+                break
+            chunks.append(data)
+    finally:
+        channel.close()  # 超时时强制关闭channel，正常结束时释放channel
+    return b''.join(chunks).decode()
@@ -0,0 +1,104 @@
+import time
+import socket
+import paramiko
+import threading
+from logging import getLogger
+from .ssh_connect import ssh_connect, safe_exec_command
+
+logger = getLogger('my.pool')
+
+
+class SSHPool:
+    """
+    按主机缓存已认证的 SSHClient，供采集器和 Web API 共享。
+    每次 exec_command / open_sftp 都在同一条 transport 上新开一个 channel (open_session)，
+    因此无需重复握手与认证；连接失效时自动重连，空闲过久的连接会被回收
+    """
+
+    def __init__(self, configs, keepalive=30, idle_timeout=600, health_interval=10):
+        self.configs = configs
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self._entries = {}  # key -> dict(client, last_used, last_check)
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(host, overrides):
+        return (host, tuple(sorted((k, str(v)) for k, v in overrides.items())))
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _is_healthy(self, entry):
+        transport = entry['client'].get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if time.time() - entry['last_check'] < self.health_interval:
+            return True
+        try:
+            transport.send_ignore()  # 轻量的存活探测
+        except (paramiko.SSHException, socket.error, EOFError):
+            return False
+        entry['last_check'] = time.time()
+        return True
+
+    def get(self, host, **overrides):
+        """ 返回 host 对应的可用连接；overrides 会覆盖 hosts.yml 中的配置 (如以 root 登录) """
+        self.evict_idle()
+        key = self._key(host, overrides)
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None and self._is_healthy(entry):
+                entry['last_used'] = time.time()
+                return entry['client']
+            if entry is not None:
+                logger.info(f"Reconnecting to {host}")
+                self._close(entry)
+            client = ssh_connect({**self.configs[host], **overrides})
+            client.get_transport().set_keepalive(self.keepalive)
+            self._entries[key] = dict(client=client, last_used=time.time(), last_check=time.time())
+            return client
+
+    def discard(self, host, **overrides):
+        """ 丢弃某个连接 (如命令执行出错后)，下次 get 时重新建立 """
+        key = self._key(host, overrides)
+        with self._key_lock(key):
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._close(entry)
+
+    def exec(self, host, command, timeout=60, **overrides):
+        """ 在池中的连接上执行命令，连接断开时重连并重试一次 """
+        try:
+            return safe_exec_command(self.get(host, **overrides), command, timeout=timeout)
+        except TimeoutError:
+            # TimeoutError 是 OSError (socket.error) 的子类；命令超时不是连接断开，重试只会再等一个 timeout
+            raise
+        except (paramiko.SSHException, socket.error, EOFError) as e:
+            logger.warning(f"Command on {host} failed ([{type(e)}] {e}), retrying with a new connection")
+            self.discard(host, **overrides)
+            return safe_exec_command(self.get(host, **overrides), command, timeout=timeout)
+
+    def evict_idle(self):
+        now = time.time()
+        with self._lock:
+            idle = [key for key, entry in self._entries.items() if now - entry['last_used'] > self.idle_timeout]
+            entries = [self._entries.pop(key) for key in idle]
+        for entry in entries:
+            self._close(entry)
+
+    def close(self):
+        with self._lock:
+            entries, self._entries = list(self._entries.values()), {}
+        for entry in entries:
+            self._close(entry)
+
+    @staticmethod
+    def _close(entry):
+        try:
+            entry['client'].close()
+        except Exception:
+            pass
@@ -0,0 +1,382 @@
+import os
+import sys
+import gzip
+import json
+import time
+import struct
+import shutil
+import threading
+import numpy as np
+from .users import host_users
+
+
+# 列名 -> (dtype, 是否按 GPU 展开)
+RECORD_COLUMNS = {
+    'timestamp': ('<f8', False),    # 时间戳
+    'cpu': ('<f4', False),          # CPU 使用率, 单位: %
+    'cpu_free': ('<f4', False),     # CPU 剩余核数
+    'memory': ('<f4', False),       # 内存使用率, 单位: %
+    'memory_free': ('<f4', False),  # 内存剩余量, 单位: MiB
+    'cuda': ('<f4', True),          # CUDA 显存使用率, 单位: %
+    'cuda_free': ('<f4', True),     # CUDA 显存剩余量, 单位: MiB
+}
+PER_USER_FIELDS = ('cpu_per_user', 'memory_per_user', 'cuda_per_user')
+# 各用户明细的二进制格式 (per_user.bin)：每行先是三个列表的长度，随后依次是各列表的条目
+PER_USER_HEADER = struct.Struct('<3H')
+PER_USER_ENTRIES = {
+    'cpu_per_user': struct.Struct('<If'),       # 用户 id, CPU 使用率 (%)
+    'memory_per_user': struct.Struct('<If'),    # 用户 id, 内存使用率 (%)
+    'cuda_per_user': struct.Struct('<bII'),     # GPU 序号 (-1 为未知), 用户 id, 显存 (MiB)
+}
+
+
+def normalize_record(data):
+    """ 统一历史上出现过的字段名 (cuda-free / cpu-free / time 字符串) """
+    if 'timestamp' not in data:
+        data['timestamp'] = time.mktime(time.strptime(data['time'], "%Y-%m-%d %H:%M:%S"))
+    for key in ('cpu_free', 'memory_free', 'cuda_free'):
+        if key not in data:
+            data[key] = data.get(key.replace('_', '-'))
+    return data
+
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _store_lock(path):
+    """ 同一存储的追加 (写入线程) 与截断 (整理任务) 在进程内互斥 """
+    with _locks_lock:
+        return _locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+class ColumnStore:
+    """
+    定长列式存储: {path}/{column}.bin 每列一个小端二进制文件，按时间顺序追加，
+    读取时用 np.memmap 映射并按时间戳二分得到切片 (不复制数据)。
+    按 GPU 展开的列每行 width 个值 (不足补 NaN)，width 记录在 meta.json 中；
+    各用户的明细列表变长，以定长条目的二进制形式存放在 per_user.bin，per_user.idx 记录每行的起始字节偏移；
+    明细中的用户名以 id 存储，写入时用 users (UserDict) 编码，读取时还原。
+    截断旧数据 (trim) 时把保留的行复制为新一代文件 ({column}.{generation}.bin)，再原子地更新 meta.json 中的 generation；
+    每个实例在第一次读取时固定当时的一代文件，之后的 read_per_user 不受截断影响
+    """
+
+    def __init__(self, path, columns=RECORD_COLUMNS, per_user=True, users=None):
+        self.path = path
+        self.columns = columns
+        self.per_user = per_user
+        self.users = users
+        self._pinned = None  # 读取时固定的 (各用户明细数据, 偏移) 映射
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, 'meta.json'))
+
+    def _file(self, name, generation=0, suffix='.bin'):
+        return os.path.join(self.path, f'{name}{suffix}' if generation == 0 else f'{name}.{generation}{suffix}')
+
+    def _per_user_files(self, generation=0):
+        """ (明细数据, 偏移) 文件 """
+        return self._file('per_user', generation), self._file('per_user', generation, '.idx')
+
+    def _meta(self):
+        with open(os.path.join(self.path, 'meta.json')) as f:
+            meta = json.load(f)
+        meta.setdefault('generation', 0)
+        return meta
+
+    def _write_meta(self, meta):
+        tmp = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, 'meta.json'))
+
+    def _row_size(self, name, width):
+        dtype, per_gpu = self.columns[name]
+        return np.dtype(dtype).itemsize * (width if per_gpu else 1)
+
+    def _len(self, meta):
+        """ 以最短的列为准 (追加写入中途崩溃时，多出的半行会被忽略) """
+        width, generation = meta['width'], meta['generation']
+        rows = [os.path.getsize(self._file(name, generation)) // self._row_size(name, width)
+                for name in self.columns if self._row_size(name, width) > 0]
+        if self.per_user:
+            rows.append(os.path.getsize(self._per_user_files(generation)[1]) // 8)
+        return min(rows)
+
+    def _snapshot(self, retries=3):
+        """ 当前的 (meta, 行数)；读取途中恰好被 trim 切换到新一代文件时重试 """
+        for attempt in range(retries):
+            meta = self._meta()
+            try:
+                return meta, self._len(meta)
+            except FileNotFoundError:
+                if attempt == retries - 1:
+                    raise
+
+    def __len__(self):
+        if not self.exists():
+            return 0
+        return self._snapshot()[1]
+
+    def _widen(self, meta, width):
+        """ GPU 数量增加时，把按 GPU 展开的列重写为更宽的格式 """
+        rows, generation = self._len(meta), meta['generation']
+        for name, (dtype, per_gpu) in self.columns.items():
+            if not per_gpu: continue
+            path = self._file(name, generation)
+            old = np.fromfile(path, dtype=dtype, count=rows * meta['width']).reshape(rows, meta['width'])
+            new = np.full((rows, width), np.nan, dtype=dtype)
+            new[:, :meta['width']] = old
+            new.tofile(path + '.tmp')
+            os.replace(path + '.tmp', path)
+        meta['width'] = width
+        self._write_meta(meta)
+
+    def _repair(self, meta):
+        """ 截掉上次追加中途崩溃留下的多余数据，保证各列行数一致后再追加 """
+        rows, width, generation = self._len(meta), meta['width'], meta['generation']
+        for name in self.columns:
+            path = self._file(name, generation)
+            if os.path.getsize(path) != rows * self._row_size(name, width):
+                os.truncate(path, rows * self._row_size(name, width))
+        if not self.per_user:
+            return
+        data_path, off_path = self._per_user_files(generation)
+        if os.path.getsize(off_path) != rows * 8:
+            os.truncate(off_path, rows * 8)
+        end = 0
+        if rows > 0:
+            with open(off_path, 'rb') as f:
+                f.seek((rows - 1) * 8)
+                last = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+            with open(data_path, 'rb') as f:
+                f.seek(last)
+                counts = PER_USER_HEADER.unpack(f.read(PER_USER_HEADER.size))
+            end = last + PER_USER_HEADER.size + sum(count * entry.size for count, entry in zip(counts, PER_USER_ENTRIES.values()))
+        if os.path.getsize(data_path) != end:
+            os.truncate(data_path, end)
+
+    def extend(self, records):
+        """ 批量追加记录 (records 需按时间戳递增) """
+        records = [normalize_record(dict(record)) for record in records]
+        if not records:
+            return
+        with _store_lock(self.path):
+            if not self.exists():
+                os.makedirs(self.path, exist_ok=True)
+                for name in self.columns:
+                    open(self._file(name), 'wb').close()
+                if self.per_user:
+                    for path in self._per_user_files():
+                        open(path, 'wb').close()
+                self._write_meta(dict(width=0, generation=0))
+            meta = self._meta()
+            self._repair(meta)
+            gpu_columns = [name for name, (_, per_gpu) in self.columns.items() if per_gpu]
+            width = max((len(record.get(name) or []) for record in records for name in gpu_columns), default=0)
+            if width > meta['width']:
+                self._widen(meta, width)
+            width = meta['width']
+            for name, (dtype, per_gpu) in self.columns.items():
+                if per_gpu:
+                    array = np.full((len(records), width), np.nan, dtype=dtype)
+                    for i, record in enumerate(records):
+                        values = record.get(name) or []
+                        array[i, :len(values)] = values
+                else:
+                    array = np.array([np.nan if record.get(name) is None else record[name] for record in records], dtype=dtype)
+                with open(self._file(name, meta['generation']), 'ab') as f:
+                    f.write(array.tobytes())
+            if self.per_user:
+                self._extend_per_user(records, meta['generation'])
+
+    def _uid(self, user):
+        """ 旧记录中的用户名在写入时编码为 id """
+        if isinstance(user, int):
+            return user
+        if self.users is None:
+            raise ValueError(f"Cannot store username {user!r} without a user dictionary")
+        return self.users.id(user)
+
+    def _pack_per_user(self, record):
+        rows = {key: record.get(key) or [] for key in PER_USER_FIELDS}
+        parts = [PER_USER_HEADER.pack(*(len(rows[key]) for key in PER_USER_FIELDS))]
+        entry = PER_USER_ENTRIES['cpu_per_user']
+        for key in ('cpu_per_user', 'memory_per_user'):
+            parts.extend(entry.pack(self._uid(user), value) for user, value in rows[key])
+        entry = PER_USER_ENTRIES['cuda_per_user']
+        for cuda, user, memory in rows['cuda_per_user']:
+            if isinstance(cuda, str):
+                cuda = int(cuda[5:]) if cuda.startswith('cuda:') else -1
+            parts.append(entry.pack(cuda, self._uid(user), int(memory)))
+        return b''.join(parts)
+
+    def _extend_per_user(self, records, generation):
+        data_path, off_path = self._per_user_files(generation)
+        with open(data_path, 'ab') as f:
+            offset = f.tell()
+            offsets, blobs = [], []
+            for record in records:
+                blob = self._pack_per_user(record)
+                offsets.append(offset)
+                blobs.append(blob)
+                offset += len(blob)
+            f.write(b''.join(blobs))
+        with open(off_path, 'ab') as f:
+            f.write(np.array(offsets, dtype='<u8').tobytes())
+
+    def append(self, record):
+        self.extend([record])
+
+    @staticmethod
+    def _copy(src, dst, offset):
+        """ 把 src 从 offset 开始的部分复制到 dst """
+        with open(src, 'rb') as f, open(dst, 'wb') as out:
+            f.seek(offset)
+            shutil.copyfileobj(f, out, 1 << 20)
+
+    def trim(self, before):
+        """
+        删除时间戳早于 before 的行 (保留期限)，返回删除的行数。
+        保留的行复制为新一代文件后原子地切换 meta.json，再删除其他各代的文件 (含上次截断中断留下的)
+        """
+        if not self.exists():
+            return 0
+        with _store_lock(self.path):
+            meta = self._meta()
+            self._repair(meta)
+            rows, width, generation = self._len(meta), meta['width'], meta['generation']
+            timestamp = self._memmap('timestamp', width, rows, generation)
+            drop = int(np.searchsorted(timestamp, before, side='left'))
+            del timestamp
+            if drop > 0:
+                new = generation + 1
+                for name in self.columns:
+                    self._copy(self._file(name, generation), self._file(name, new), drop * self._row_size(name, width))
+                if self.per_user:
+                    data_path, off_path = self._per_user_files(generation)
+                    offsets = np.fromfile(off_path, dtype='<u8', count=rows)
+                    base = int(offsets[drop]) if drop < rows else os.path.getsize(data_path)
+                    (offsets[drop:] - np.uint64(base)).astype('<u8').tofile(self._per_user_files(new)[1])
+                    self._copy(data_path, self._per_user_files(new)[0], base)
+                meta['generation'] = new
+                self._write_meta(meta)
+            keep = {os.path.basename(self._file(name, meta['generation'])) for name in self.columns}
+            keep.update(os.path.basename(path) for path in self._per_user_files(meta['generation']))
+            for entry in os.scandir(self.path):
+                if entry.is_file() and entry.name.endswith(('.bin', '.idx')) and entry.name not in keep:
+                    os.remove(entry.path)
+        return drop
+
+    def _memmap(self, name, width, rows, generation=0):
+        dtype, per_gpu = self.columns[name]
+        shape = (rows, width) if per_gpu else (rows,)
+        if rows == 0 or (per_gpu and width == 0):
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self._file(name, generation), dtype=dtype, mode='r', shape=shape)
+
+    def _pin(self, meta, rows):
+        """ 固定本次读取使用的各用户明细文件 (映射在文件被 trim 删除后仍然有效) """
+        if self.per_user and rows > 0:
+            data_path, off_path = self._per_user_files(meta['generation'])
+            self._pinned = (np.memmap(data_path, dtype='u1', mode='r'), np.memmap(off_path, dtype='<u8', mode='r', shape=(rows,)))
+
+    def last_timestamp(self):
+        timestamp = self.read(columns=['timestamp'], tail=1)['timestamp']
+        return float(timestamp[-1]) if len(timestamp) else None
+
+    def read(self, start=-np.inf, end=np.inf, columns=None, tail=None):
+        """
+        读取 [start, end] 内的记录，返回 {列名: ndarray}，数组是 memmap 上的切片视图 (零拷贝)；
+        另外返回 'rows' = (i0, i1) 供 read_per_user 使用。tail 不为 None 时只取最后 tail 行
+        """
+        empty = {name: np.empty((0,), dtype=self.columns[name][0]) for name in (columns or self.columns)} | {'rows': (0, 0)}
+        if not self.exists():
+            return empty
+        for attempt in range(3):
+            meta, rows = self._snapshot()
+            if rows == 0:
+                return empty
+            width, generation = meta['width'], meta['generation']
+            try:
+                timestamp = self._memmap('timestamp', width, rows, generation)
+                if tail is None:
+                    i0 = int(np.searchsorted(timestamp, start, side='left'))
+                    i1 = int(np.searchsorted(timestamp, end, side='right'))
+                else:
+                    i0, i1 = max(rows - tail, 0), rows
+                result = {name: self._memmap(name, width, rows, generation)[i0:i1] for name in (columns or self.columns)}
+                if columns is None and tail is None:
+                    self._pin(meta, rows)
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+                continue
+            result['rows'] = (i0, i1)
+            return result
+
+    def read_per_user(self, i0, i1):
+        """ 读取第 [i0, i1) 行的各用户明细 (行号来自同一实例上的 read)，返回 [{cpu_per_user: ..., ...}, ...] """
+        if i1 <= i0:
+            return []
+        if self._pinned is None:
+            self._pin(*self._snapshot())
+        data, offsets = self._pinned
+        begin = int(offsets[i0])
+        blob = data[begin:int(offsets[i1]) if i1 < len(offsets) else len(data)].tobytes()
+        result, position = [], 0
+        for _ in range(i1 - i0):
+            counts = PER_USER_HEADER.unpack_from(blob, position)
+            position += PER_USER_HEADER.size
+            item = {}
+            for key, count in zip(PER_USER_FIELDS, counts):
+                entry = PER_USER_ENTRIES[key]
+                end = position + count * entry.size
+                item[key] = [list(values) for values in entry.iter_unpack(blob[position:end])]
+                position = end
+            for row in item['cuda_per_user']:
+                if row[0] < 0:
+                    row[0] = 'UNKNOWN'
+            result.append(item)
+        if self.users is not None:
+            result = [self.users.decode(item) for item in result]
+        return result
+
+
+def column_store(host, data_dir='./data'):
+    return ColumnStore(os.path.join(data_dir, 'columns', host), users=host_users(host, data_dir))
+
+
+def import_jsonl(file_path, store, batch_size=10000):
+    """ 把 data/{host}.json 或其分段 (JSONL，.gz 为压缩的分段) 导入列式存储，只追加比现有数据更新的记录 """
+    last = store.last_timestamp()
+    last = -np.inf if last is None else last
+    batch, count = [], 0
+    with (gzip.open if file_path.endswith('.gz') else open)(file_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = normalize_record(json.loads(line))
+            except Exception:
+                continue
+            if record['timestamp'] <= last:
+                continue
+            last = record['timestamp']
+            batch.append(record)
+            if len(batch) >= batch_size:
+                store.extend(batch)
+                count += len(batch)
+                batch = []
+    store.extend(batch)
+    return count + len(batch)
+
+
+if __name__ == '__main__':
+    # python -m src.storage [data_dir]: 把 data_dir 下所有 {host}.json 及其分段导入 {data_dir}/columns/{host}
+    from .segments import host_segments
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else './data'
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith('.json'): continue
+        host = filename.removesuffix('.json')
+        store = column_store(host, data_dir)
+        count = sum(import_jsonl(file_path, store) for file_path in host_segments(host, data_dir).files())
+        print(f"{host}: imported {count} records")
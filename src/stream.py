@@ -0,0 +1,154 @@
+import os
+import json
+import numpy as np
+from logging import getLogger
+from .storage import normalize_record
+from .time_index import TimeIndex, find_start_offset
+from .segments import host_segments, open_segment
+from .users import host_users
+
+try:
+    import orjson
+    dumps, loads = orjson.dumps, orjson.loads
+except ImportError:  # orjson 是可选依赖
+    dumps = lambda obj: json.dumps(obj, separators=(',', ':')).encode()
+    loads = json.loads
+
+logger = getLogger('my.web')
+
+
+def history_row(data, host, mapping, users=None):
+    """
+    把一条原始记录转换为 /api/history 的输出格式 (与 Record 字段一致)，不构造 pydantic 对象；
+    users 为该主机的 UserDict，用于还原以 id 存储的用户名
+    """
+    normalize_record(data)
+    if users is not None:
+        users.decode(data)
+    cuda_per_user = data.get('cuda_per_user') or []
+    return {
+        'timestamp': float(data['timestamp']),
+        'host': host,
+        'user': None,
+        'cpu': data['cpu'],
+        'memory': data['memory'],
+        'cuda': data['cuda'],
+        'cpu_free': data['cpu_free'],
+        'memory_free': data['memory_free'],
+        'cuda_free': data['cuda_free'],
+        'cuda_per_user': [[row[0], mapping.get(row[1], row[1]), row[2]] for row in cuda_per_user],
+    }
+
+
+def iter_jsonl_lines(file_path, start, end, chunk_size=1 << 20):
+    """
+    按块读取 JSONL 中覆盖 [start, end] 的部分，逐行产出 (bytes)；末尾未写完的行会被丢弃。
+    压缩的分段 (.gz) 没有时间索引，顺序解压全部行
+    """
+    if file_path.endswith('.gz'):
+        with open_segment(file_path) as f:
+            yield from f
+        return
+    index = TimeIndex(file_path)
+    with open(file_path, 'rb') as f:
+        if index.exists():
+            start_offset, end_offset = index.find_range(start, end)
+            f.seek(start_offset)
+            remaining = end_offset - start_offset
+        else:
+            f.seek(find_start_offset(file_path, start))
+            f.readline()
+            remaining = None
+        buffer = b''
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            lines = (buffer + chunk).split(b'\n')
+            buffer = lines.pop()
+            yield from lines
+
+
+def iter_segment_lines(host, data_dir, start, end):
+    """ 依次读取与 [start, end] 有重叠的分段 (见 src/segments.py)，其余分段不会被打开 """
+    for path in host_segments(host, data_dir).files(start, end):
+        if not os.path.exists(path) and os.path.exists(path + '.gz'):
+            path += '.gz'  # 读取清单后刚被压缩
+        try:
+            yield from iter_jsonl_lines(path, start, end)
+        except FileNotFoundError:
+            continue  # 读取清单后刚被删除 (超过保留期限)
+
+
+def iter_jsonl_rows(file_path, host, start, end, mapping):
+    """ file_path 为主机当前的数据文件 data/{host}.json，更早的记录从同目录下的分段读取 """
+    data_dir = os.path.dirname(file_path)
+    users = host_users(host, data_dir)
+    for line in iter_segment_lines(host, data_dir, start, end):
+        if not line.strip():
+            continue
+        try:
+            row = history_row(loads(line), host, mapping, users)
+        except Exception as e:
+            # 如果某行解析失败，打印一下日志并跳过
+            logger.error(f"parse error: {e}  --  line: {line.strip()}")
+            continue
+        if row['timestamp'] < start:
+            continue
+        if row['timestamp'] > end:
+            break
+        yield row
+
+
+def _nan_to_none(values):
+    return [None if v != v else v for v in values]
+
+
+def iter_column_rows(store, host, start, end, mapping, chunk_rows=4096):
+    """ 从列式存储按块 (chunk_rows 行) 读取 [start, end] 内的记录，内存占用与区间长度无关 """
+    data = store.read(start, end)
+    i0, i1 = data['rows']
+    for a in range(0, i1 - i0, chunk_rows):
+        b = min(a + chunk_rows, i1 - i0)
+        per_user = store.read_per_user(i0 + a, i0 + b)
+        # 按 GPU 展开的列末尾用 NaN 补齐，按非 NaN 的个数截断
+        cuda, cuda_free = data['cuda'][a:b], data['cuda_free'][a:b]
+        width = (~np.isnan(cuda)).sum(axis=1).tolist() if cuda.ndim == 2 else [0] * (b - a)
+        cuda, cuda_free = cuda.tolist(), cuda_free.tolist()
+        columns = zip(
+            data['timestamp'][a:b].tolist(), data['cpu'][a:b].tolist(), data['memory'][a:b].tolist(),
+            _nan_to_none(data['cpu_free'][a:b].tolist()), _nan_to_none(data['memory_free'][a:b].tolist()),
+        )
+        for i, (timestamp, cpu, memory, cpu_free, memory_free) in enumerate(columns):
+            yield {
+                'timestamp': timestamp,
+                'host': host,
+                'user': None,
+                'cpu': cpu,
+                'memory': memory,
+                'cuda': cuda[i][:width[i]],
+                'cpu_free': cpu_free,
+                'memory_free': memory_free,
+                'cuda_free': cuda_free[i][:width[i]],
+                'cuda_per_user': [[row[0], mapping.get(row[1], row[1]), row[2]] for row in per_user[i]['cuda_per_user']],
+            }
+
+
+def stream_json_array(rows, chunk_size=1 << 16):
+    """ 把 rows 编码为 JSON 数组，按约 chunk_size 字节分块产出；'[' 立即发出 """
+    yield b'['
+    buffer, size, first = [], 0, True
+    for row in rows:
+        item = dumps(row)
+        if not first:
+            buffer.append(b',')
+        first = False
+        buffer.append(item)
+        size += len(item) + 1
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    buffer.append(b']')
+    yield b''.join(buffer)
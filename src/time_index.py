@@ -0,0 +1,133 @@
+import os
+import json
+import numpy as np
+from .storage import normalize_record
+
+
+INDEX_DTYPE = np.dtype([('timestamp', '<f8'), ('offset', '<u8')])
+
+
+def get_timestamp(line):
+    """ 从一行 JSON 中取出 timestamp (兼容旧的 'time' 字段) """
+    return float(normalize_record(json.loads(line))['timestamp'])
+
+
+class TimeIndex:
+    """
+    JSONL 数据文件的稀疏时间索引 ({file}.idx)：每隔约 every 字节记录一条 (timestamp, offset)，
+    offset 总是某一行的起始位置。由采集器在追加时增量维护，读取时只需对内存中的数组二分，
+    不再对数据文件做 seek + readline + json.loads 的二分查找
+    """
+
+    def __init__(self, file_path, every=64 * 1024):
+        self.file_path = file_path
+        self.path = file_path + '.idx'
+        self.every = every
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        if not self.exists():
+            return np.empty(0, dtype=INDEX_DTYPE)
+        entries = os.path.getsize(self.path) // INDEX_DTYPE.itemsize  # 忽略写了一半的条目
+        return np.fromfile(self.path, dtype=INDEX_DTYPE, count=entries)
+
+    def _last(self):
+        entries = os.path.getsize(self.path) // INDEX_DTYPE.itemsize if self.exists() else 0
+        if entries == 0:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek((entries - 1) * INDEX_DTYPE.itemsize)
+            return np.frombuffer(f.read(INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)[0]
+
+    def _write(self, entries):
+        with open(self.path, 'ab') as f:
+            if f.tell() % INDEX_DTYPE.itemsize:
+                f.truncate(f.tell() - f.tell() % INDEX_DTYPE.itemsize)
+            f.write(np.array(entries, dtype=INDEX_DTYPE).tobytes())
+
+    def add(self, timestamp, offset):
+        """ 采集器每追加一行后调用；距上一条索引超过 every 字节时才写入新条目 """
+        last = self._last()
+        if last is None or offset - int(last['offset']) >= self.every:
+            self._write([(timestamp, offset)])
+
+    def build(self):
+        """ 从最后一条索引开始扫描数据文件，补齐缺失的索引 (首次运行时即为整个文件建立索引) """
+        if not os.path.exists(self.file_path):
+            return
+        last = self._last()
+        entries = []
+        with open(self.file_path, 'rb') as f:
+            offset = 0 if last is None else int(last['offset'])
+            previous = None if last is None else offset
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # 最后一行尚未写完
+                if previous is None or offset - previous >= self.every:
+                    try:
+                        entries.append((get_timestamp(line), offset))
+                        previous = offset
+                    except Exception:
+                        pass
+                offset += len(line)
+        self._write(entries)
+
+    def find_range(self, start, end):
+        """
+        返回覆盖 [start, end] 的字节区间 (start_offset, end_offset)，两端都在行首；
+        区间两端可能多出少量记录，调用方仍需按时间戳过滤。
+        索引之后新追加的数据 (尚未建立索引) 都包含在区间内
+        """
+        entries = self.load()
+        file_size = os.path.getsize(self.file_path)
+        if len(entries) == 0:
+            return 0, file_size
+        i = int(np.searchsorted(entries['timestamp'], start, side='left')) - 1
+        j = int(np.searchsorted(entries['timestamp'], end, side='right'))
+        start_offset = int(entries['offset'][i]) if i >= 0 else 0
+        end_offset = int(entries['offset'][j]) if j < len(entries) else file_size
+        return start_offset, end_offset
+
+
+def find_start_offset(file_path: str, start_ts: float) -> int:
+    """
+    没有索引时的退路：在 sorted-by-timestamp 的文件里，使用二分查找来定位第一个 timestamp >= start_ts 的“附近”字节偏移。
+    返回值是一个 file.seek() 可以使用的字节偏移位置，我们会在此偏移再做一次 readline() 丢掉残行。
+    """
+    file_size = os.path.getsize(file_path)
+    low, high = 0, file_size
+    result_offset = 0
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        while low <= high:
+            mid = (low + high) // 2
+            f.seek(mid)
+
+            # 丢弃当前这一行的不完整部分
+            f.readline()
+            line = f.readline()
+            if not line:
+                # 如果 mid 已经靠近文件末尾，往前移动高位
+                high = mid - 1
+                continue
+
+            try:
+                ts = get_timestamp(line)
+            except Exception:
+                # 如果 JSON 解析失败，就往后或往前稍微移动一点再试
+                # 这里简单起见，把 mid 往后调一点
+                low = mid + 1
+                continue
+
+            if ts < start_ts:
+                # 目标在文件后半段
+                low = mid + 1
+            else:
+                # ts >= start_ts，记住这个位置有可能是我们要的“起点”
+                result_offset = mid
+                high = mid - 1
+
+    return result_offset
@@ -0,0 +1,102 @@
+import os
+import re
+import threading
+
+# 无法解析属主的进程记为 PID{pid} (见 get_cpu.py、get_cuda.py)，不写入字典，统一编码为保留的 id
+UNKNOWN_UID = 0xFFFFFFFF
+UNKNOWN_USER = 'UNKNOWN'
+PSEUDO_USER = re.compile(r'PID\d+')
+
+
+class UserDict:
+    """
+    单台主机的用户名字典 data/{host}.users：每行一个用户名，行号即用户 id，只追加不修改。
+    记录中的各用户明细以 id 代替用户名存储:
+        cpu_per_user / memory_per_user: [[uid, value], ...]
+        cuda_per_user: [[gpu_index, uid, memory_mib], ...]
+    旧记录中的字符串保持不变，解码时按类型区分。
+    PID{pid} 形式的伪用户名不写入字典 (否则繁忙主机上字典会无限增长)，统一编码为 UNKNOWN_UID
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._names = []
+        self._ids = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _reload(self):
+        """ 只读取上次之后新追加的部分 """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == self._size:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._size)
+            data = f.read()
+        data = data[:data.rfind(b'\n') + 1]  # 忽略写了一半的行
+        for name in data.decode('utf-8').splitlines():
+            self._ids[name] = len(self._names)
+            self._names.append(name)
+        self._size += len(data)
+
+    def id(self, name):
+        """ 返回用户名对应的 id，新用户名会先写入字典文件 (在引用它的记录写入之前) """
+        if PSEUDO_USER.fullmatch(name):
+            return UNKNOWN_UID
+        uid = self._ids.get(name)
+        if uid is not None:
+            return uid
+        with self._lock:
+            self._reload()
+            if name not in self._ids:
+                with open(self.path, 'ab') as f:
+                    f.write((name + '\n').encode('utf-8'))
+                self._reload()
+            return self._ids[name]
+
+    def name(self, uid):
+        if uid == UNKNOWN_UID:
+            return UNKNOWN_USER
+        if uid >= len(self._names):
+            with self._lock:
+                self._reload()
+        return self._names[uid] if uid < len(self._names) else f'UID{uid}'
+
+    def encode(self, record):
+        """ 返回用 id 编码各用户明细后的新记录 """
+        record = dict(record)
+        for key in ('cpu_per_user', 'memory_per_user'):
+            if key in record:
+                record[key] = [[self.id(user), value] for user, value in record[key]]
+        if 'cuda_per_user' in record:
+            record['cuda_per_user'] = [
+                [int(cuda[5:]) if cuda.startswith('cuda:') else cuda, self.id(user), memory]
+                for cuda, user, memory in record['cuda_per_user']
+            ]
+        return record
+
+    def decode(self, record):
+        """ 把记录中的用户 id 还原为用户名 (原地修改并返回)；未编码的旧记录原样返回 """
+        for key in ('cpu_per_user', 'memory_per_user'):
+            rows = record.get(key)
+            if rows and isinstance(rows[0][0], int):
+                record[key] = [[self.name(uid), value] for uid, value in rows]
+        rows = record.get('cuda_per_user')
+        if rows and isinstance(rows[0][1], int):
+            record['cuda_per_user'] = [
+                [f'cuda:{cuda}' if isinstance(cuda, int) else cuda, self.name(uid), memory]
+                for cuda, uid, memory in rows
+            ]
+        return record
+
+
+_user_dicts = {}
+_lock = threading.Lock()
+
+
+def host_users(host, data_dir='./data'):
+    """ 每台主机共享一个 UserDict 实例 (进程内缓存) """
+    path = os.path.join(data_dir, f'{host}.users')
+    with _lock:
+        if path not in _user_dicts:
+            _user_dicts[path] = UserDict(path)
+        return _user_dicts[path]
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import queue
+import threading
+from logging import getLogger
+from .storage import column_store, import_jsonl
+from .rollup import update_rollups
+from .time_index import TimeIndex
+from .segments import Segments, host_segments, segment_day, read_first_line, parse_timestamp
+from .users import host_users
+
+logger = getLogger('my.writer')
+
+
+def repair_tail(file_path):
+    """ 截掉 JSONL 末尾没有写完的行 (上次写入时进程或机器崩溃)，返回截掉的字节数 """
+    if not os.path.exists(file_path):
+        return 0
+    with open(file_path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        position = size
+        while position > 0:
+            step = min(65536, position)
+            f.seek(position - step)
+            block = f.read(step)
+            if position == size and block.endswith(b'\n'):
+                return 0
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                position = position - step + newline + 1
+                break
+            position -= step
+        f.truncate(position)
+    logger.warning(f"Dropped a partial trailing line ({size - position} bytes) from {file_path}")
+    return size - position
+
+
+class RecordWriter:
+    """
+    采集器的写入阶段：所有主机的样本经队列交给一个写线程，按文件分组提交 (group commit)。
+    每个数据文件保持一个打开的句柄，一次提交的若干整行用一次 write 追加 (O_APPEND)，
+    样本最多在队列中等待 flush_interval 秒；fsync=True 时每次提交后 fsync。
+    日期变化时先把当前文件封存为按天的分段 (见 src/segments.py)。
+    提交后再更新时间索引、列式存储、汇总和用户用量统计；
+    派生数据更新失败的主机记为落后，下次提交时先从 JSONL 补齐 (见 _catch_up)，列式存储不会留下空洞
+    """
+
+    def __init__(self, save_path, flush_interval=1.0, max_batch=1024, fsync=False):
+        self.save_path = save_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self._queue = queue.Queue()
+        self._fds = {}
+        self._days = {}  # 数据文件 -> 当前分段的日期
+        self._stale = set()  # 派生数据落后于 JSONL 的主机
+        self._thread = threading.Thread(target=self._run, name='writer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, record, usage):
+        """ 提交一个样本 (不阻塞，可在事件循环中调用)；usage 为该主机的 UsageAccumulator """
+        self._queue.put((record, usage))
+
+    def close(self):
+        """ 写完队列中剩余的样本后关闭所有文件 """
+        self._queue.put(None)
+        self._thread.join()
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch, deadline, stop = [item], time.monotonic() + self.flush_interval, False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            groups = {}
+            for record, usage in batch:
+                groups.setdefault(record['host'], ([], usage))[0].append(record)
+            for host, (records, usage) in groups.items():
+                try:
+                    self._commit(host, records, usage)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(records)} records of {host}: [{type(e)}] {e}")
+            if stop:
+                return
+
+    def _fd(self, path):
+        if path not in self._fds:
+            self._fds[path] = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._fds[path]
+
+    def _day(self, path):
+        """ 当前分段的日期 (首次写入时由第一行得到) """
+        if path not in self._days:
+            line = read_first_line(path) if os.path.exists(path) else None
+            timestamp = parse_timestamp(line)
+            if timestamp is None and line is not None:
+                try:
+                    timestamp, _ = Segments._time_range(path)  # 第一行损坏
+                except ValueError:
+                    pass
+            self._days[path] = None if timestamp is None else segment_day(timestamp)
+        return self._days[path]
+
+    def _append(self, path, lines):
+        """ 一次 write 追加若干整行，返回写入前的文件大小 """
+        fd = self._fd(path)
+        offset = os.fstat(fd).st_size
+        data = b''.join(lines)
+        try:
+            written = 0
+            while written < len(data):
+                written += os.write(fd, data[written:])
+            if self.fsync:
+                os.fsync(fd)
+        except OSError:
+            os.close(self._fds.pop(path))  # 下次重新打开
+            raise
+        return offset
+
+    def _commit(self, host, records, usage):
+        path = os.path.join(self.save_path, f'{host}.json')
+        users = host_users(host, self.save_path)
+        encoded = [users.encode(record) for record in records]
+        lines = [(json.dumps(record) + '\n').encode() for record in encoded]
+        # 按日期切分：日期晚于当前分段时先封存当前分段 (时钟回拨的样本留在当前分段)
+        i = 0
+        while i < len(records):
+            day = segment_day(records[i]['timestamp'])
+            j = i + 1
+            while j < len(records) and segment_day(records[j]['timestamp']) == day:
+                j += 1
+            if self._day(path) is not None and day > self._day(path):
+                if path in self._fds:
+                    os.close(self._fds.pop(path))
+                host_segments(host, self.save_path).seal()
+                self._days[path] = None
+            offset = self._append(path, lines[i:j])
+            if self._days[path] is None:
+                self._days[path] = day
+            index = TimeIndex(path)
+            for record, line in zip(records[i:j], lines[i:j]):
+                index.add(record['timestamp'], offset)
+                offset += len(line)
+            i = j
+        try:
+            if host in self._stale:
+                self._catch_up(host, usage)
+            else:
+                self._derive(host, encoded, records, usage)
+        except Exception as e:
+            self._stale.add(host)
+            logger.error(f"Failed to update derived data of {host}, will re-import from JSONL: [{type(e)}] {e}")
+
+    def _derive(self, host, encoded, records, usage):
+        """ 把刚写入 JSONL 的样本追加到列式存储、汇总和用量统计 """
+        store = column_store(host, self.save_path)
+        # 列式存储按时间戳二分读取，不晚于已有数据的样本 (如时钟回拨) 只保留在 JSONL 中 (同 import_jsonl)
+        last = store.last_timestamp()
+        last = float('-inf') if last is None else last
+        fresh = []
+        for record in encoded:
+            if record['timestamp'] > last:
+                fresh.append(record)
+                last = record['timestamp']
+        if len(fresh) < len(encoded):
+            logger.warning(f"Skipped {len(encoded) - len(fresh)} out-of-order records of {host} in the columnar store")
+        store.extend(fresh)
+        update_rollups(store, host, self.save_path)
+        for record in records:
+            usage.fold(record)
+        usage.flush()
+
+    def _catch_up(self, host, usage):
+        """ 上次更新派生数据失败：从 JSONL 导入列式存储之后的全部样本 (含本次提交的)，再追平汇总和用量统计 """
+        store = column_store(host, self.save_path)
+        last = store.last_timestamp()
+        for file_path in host_segments(host, self.save_path).files(start=float('-inf') if last is None else last):
+            import_jsonl(file_path, store)
+        update_rollups(store, host, self.save_path)
+        usage.backfill(store)
+        self._stale.discard(host)
+        logger.info(f"Derived data of {host} caught up with JSONL")
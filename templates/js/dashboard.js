@@ -1,8 +1,14 @@
 const timers = {}; // Object to store timer IDs for each card
 async function fetchDashboardData(init = false) {
     const records = await fetch('/api/dashboard').then(response => response.json());
+    renderDashboard(records, init);
+}
+
+// 渲染若干台主机的最新数据；init 时先清空，尚无卡片的主机新建卡片，其余原地更新
+function renderDashboard(records, init = false) {
     const dashboardCards = document.getElementById('dashboardCards');
     if (init) { dashboardCards.innerHTML = ''; }
+    let created = false;
 
     records.forEach(record => {
         const cardId = record.host.replace(/[^a-z0-9]/gi, '_').toLowerCase();
@@ -12,7 +18,8 @@ async function fetchDashboardData(init = false) {
         const mean_cuda = record.cuda ? record.cuda.reduce((s, i) => s + i, 0) / record.cuda.length : 0;
         const sum_cuda = record.cuda_free ? record.cuda_free.reduce((s, i) => s + i, 0) : 0;
 
-        if (init) {
+        if (!document.getElementById(`card-${cardId}`)) {
+            created = true;
             const card = document.createElement('div');
             card.className = 'col-md-4';
             card.innerHTML = `
@@ -113,12 +120,36 @@ async function fetchDashboardData(init = false) {
         updateTimeAgo();
     });
 
-    resumeDashboardCardOrder();
+    // 只在新建了卡片时恢复用户保存的卡片顺序
+    if (created) { resumeDashboardCardOrder(); }
 }
 
-// 初始化时加载仪表盘数据
-fetchDashboardData(true);
-setInterval(fetchDashboardData, 60000);
+// 初始化时加载仪表盘数据：优先使用服务端推送 (SSE)，每台主机有新样本时立即更新；
+// 浏览器不支持或连接中断时退回每 60 秒轮询，重新连上后停止轮询
+let pollTimer = null;
+function startPolling() {
+    if (!pollTimer) { pollTimer = setInterval(fetchDashboardData, 60000); }
+}
+function stopPolling() {
+    if (pollTimer) { clearInterval(pollTimer); pollTimer = null; }
+}
+if (window.EventSource) {
+    let initialized = false;
+    const source = new EventSource('/api/dashboard/stream');
+    source.addEventListener('snapshot', event => {
+        stopPolling();
+        renderDashboard(JSON.parse(event.data), !initialized);
+        initialized = true;
+    });
+    source.addEventListener('update', event => renderDashboard([JSON.parse(event.data)]));
+    source.onerror = () => {
+        if (!initialized) { fetchDashboardData(true); initialized = true; }
+        startPolling();
+    };
+} else {
+    fetchDashboardData(true);
+    startPolling();
+}
 
 
 // 切换编辑模式
@@ -24,15 +24,20 @@ async function fetchHistoryData() {
     // 将日期转换为时间戳
     const start = new Date(startDate).getTime() / 1000 - 8 * 3600;
     const end = new Date(endDate).getTime() / 1000 + 24 * 60 * 60 - 8 * 3600; // 结束日期加一天
-    const response = await fetch(`/api/history?host=${host}&start=${start}&end=${end}`);
-    const data = await response.json();
-
-    // 对数据进行排序
-    data.sort((a, b) => a.timestamp - b.timestamp);
+    // 点数不超过图表宽度 (像素)，时间范围较长时由服务端改用 1 分钟 / 10 分钟 / 1 小时汇总数据
+    const container = document.getElementById('history-chart');
+    const maxPoints = Math.max(Math.round(container.clientWidth), 300);
+    // 按列返回: { timestamp: [...], cpu: [...], memory: [...], cuda: [[...] 每个 GPU], cuda_free: [[...]] }
+    const [data, usage] = await Promise.all([
+        fetch(`/api/history?host=${host}&start=${start}&end=${end}&format=columnar&max_points=${maxPoints}`).then(response => response.json()),
+        // 用户用量由服务端按天累计，不需要逐行的 cuda_per_user
+        fetch(`/api/usage?host=${host}&start=${startDate}&end=${endDate}`).then(response => response.json()),
+    ]);
+    const n = data.timestamp.length;
 
     // x轴时间标签
-    const labels = data.map(record => {
-        const d = new Date(record.timestamp * 1000);
+    const labels = data.timestamp.map(timestamp => {
+        const d = new Date(timestamp * 1000);
         // return d.toISOString().slice(0, 16).replace('T', ' ');
         return d.toLocaleString('zh-CN', {
             hour12: false,
@@ -47,22 +52,25 @@ async function fetchHistoryData() {
 
 
     // CPU 和 Memory 数据
-    const cpuData = data.map(record => record.cpu);
-    const memData = data.map(record => record.memory);
+    const cpuData = data.cpu;
+    const memData = data.memory;
 
-    // CUDA 是二维数组，找最大 GPU 数目
-    const maxCudaCount = Math.max(...data.map(record => record.cuda.length));
+    // CUDA 每个 GPU 一个数组，缺失值为 null
+    const maxCudaCount = data.cuda.length;
 
     // 准备每个 GPU 的堆叠数据，缺失补0
     let cudaSeries = [];
     let maxCudaMemory = 0;
     for (let i = 0; i < maxCudaCount; i++) {
-        arr = data.map(record => (record.cuda[i] !== undefined ? (
-            record.cuda[i] * record.cuda_free[i] / (100 - record.cuda[i]) / 1024
-        ) : 0));
-        maxCudaMemory += Math.max(...data.map(record => (record.cuda[i] !== undefined ? (
-            100 * record.cuda_free[i] / (100 - record.cuda[i]) / 1024
-        ) : 0)));
+        const cuda = data.cuda[i], cudaFree = data.cuda_free[i];
+        let arr = new Array(n);
+        let maxTotal = 0;
+        for (let j = 0; j < n; j++) {
+            if (cuda[j] === null || cudaFree[j] === null) { arr[j] = 0; continue; }
+            arr[j] = cuda[j] * cudaFree[j] / (100 - cuda[j]) / 1024;
+            maxTotal = Math.max(maxTotal, 100 * cudaFree[j] / (100 - cuda[j]) / 1024);
+        }
+        maxCudaMemory += maxTotal;
         cudaSeries[i] = {
             name: `cuda:${i}`,
             type: 'line',
@@ -73,7 +81,6 @@ async function fetchHistoryData() {
         }
     }
 
-    const container = document.getElementById('history-chart');
     container.innerHTML = '';
     const colDiv = document.createElement('div');
     colDiv.className = 'col-md-12';
@@ -184,59 +191,16 @@ async function fetchHistoryData() {
     });
 
 
-    // --- 2. 新增：计算并渲染用户 GPU 使用统计图 ---
-    
-    // 数据结构: { username: { total_gib_h: 0.0, peak_gib: 0.0 } }
-    let userStats = {};
-
-    for (let i = 0; i < data.length; i++) {
-        let record = data[i];
-        
-        // 计算当前时刻每个用户的显存使用量 (GiB)
-        let currentStepUserUsage = {}; // user -> total_mem_at_this_moment (GiB)
-        
-        if (record.cuda_per_user) {
-            record.cuda_per_user.forEach(item => {
-                // item: [gpu_id, username, mem_mib]
-                let user = item[1];
-                let mem_mib = item[2];
-                if (!currentStepUserUsage[user]) currentStepUserUsage[user] = 0;
-                currentStepUserUsage[user] += mem_mib;
-            });
-        }
-
-        // 更新峰值和累积量
-        for (let user in currentStepUserUsage) {
-            let mem_gib = currentStepUserUsage[user] / 1024.0;
-            
-            if (!userStats[user]) userStats[user] = { total_gib_h: 0, peak_gib: 0 };
-            
-            // 更新峰值
-            if (mem_gib > userStats[user].peak_gib) {
-                userStats[user].peak_gib = mem_gib;
-            }
-
-            // 更新积分 (Total Usage = sum(mem * dt))
-            // 只有当不是最后一个点时，才能计算到下一个点的时间段
-            if (i < data.length - 1) {
-                let nextRecord = data[i+1];
-                let dt_hours = (nextRecord.timestamp - record.timestamp) / 3600.0;
-                // 简单的左矩形积分
-                userStats[user].total_gib_h += mem_gib * dt_hours;
-            }
-        }
-    }
+    // --- 2. 新增：渲染用户 GPU 使用统计图 ---
 
-    // 转换为数组以便绘图
-    let userList = Object.keys(userStats);
-    // 过滤掉系统用户或使用量极小的用户 (可选)
-    userList = userList.filter(u => userStats[u].total_gib_h > 0.01 || userStats[u].peak_gib > 0.1);
-    // 按总用量排序
-    userList.sort((a, b) => userStats[b].total_gib_h - userStats[a].total_gib_h);
+    // 过滤掉使用量极小的用户，按显存总用量排序
+    const userList = usage
+        .filter(u => u.gpu_memory_gib_hours > 0.01 || u.gpu_hours > 0.01)
+        .sort((a, b) => b.gpu_memory_gib_hours - a.gpu_memory_gib_hours);
 
-    const users = userList;
-    const totalUsageData = userList.map(u => userStats[u].total_gib_h.toFixed(2));
-    const peakUsageData = userList.map(u => userStats[u].peak_gib.toFixed(2));
+    const users = userList.map(u => u.user);
+    const totalUsageData = userList.map(u => u.gpu_memory_gib_hours.toFixed(2));
+    const gpuHoursData = userList.map(u => u.gpu_hours.toFixed(2));
 
     // 渲染 Bar Chart
     const usageContainer = document.getElementById('user-usage-chart');
@@ -249,7 +213,7 @@ async function fetchHistoryData() {
             axisPointer: { type: 'shadow' }
         },
         legend: {
-            data: ['总用量 (GiB·h)', '峰值显存 (GiB)']
+            data: ['总用量 (GiB·h)', 'GPU 卡时 (h)']
         },
         grid: {
             left: '3%',
@@ -271,7 +235,7 @@ async function fetchHistoryData() {
             },
             {
                 type: 'value',
-                name: '峰值显存 (GiB)',
+                name: 'GPU 卡时 (h)',
                 position: 'right',
                 axisLine: { show: true, lineStyle: { color: '#91CC75' } },
                 splitLine: { show: false }
@@ -285,10 +249,10 @@ async function fetchHistoryData() {
                 itemStyle: { color: '#5470C6' }
             },
             {
-                name: '峰值显存 (GiB)',
+                name: 'GPU 卡时 (h)',
                 type: 'bar',
                 yAxisIndex: 1,
-                data: peakUsageData,
+                data: gpuHoursData,
                 itemStyle: { color: '#91CC75' }
             }
         ]
@@ -17,7 +17,9 @@
     titleEl.textContent = `服务器详情：${host}`;
     preEl.textContent = '加载中...';
 
-    fetch(`/api/server_info?host=${encodeURIComponent(host)}`)
+    // 页面地址带 refresh=true 时让服务端重新探测，否则返回缓存
+    const refresh = getQueryParam('refresh') === 'true' ? '&refresh=true' : '';
+    fetch(`/api/server_info?host=${encodeURIComponent(host)}${refresh}`)
         .then(resp => {
             if (!resp.ok) return resp.text().then(t => { throw new Error(t || resp.statusText); });
             return resp.text();